@@ -1,22 +1,73 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QFormLayout, QLineEdit, QPushButton, QLabel, QGroupBox,
-                             QDialog, QInputDialog, QMessageBox, QListWidget, QDateEdit, QHBoxLayout)
-from PyQt5.QtCore import QDate
+                             QDialog, QInputDialog, QMessageBox, QListView, QDateEdit, QHBoxLayout, QProgressBar,
+                             QFileDialog, QComboBox, QCheckBox)
+from PyQt5.QtCore import QDate, QObject, QTimer, pyqtSignal, pyqtSlot
 
+import threading
+
+import startup
 from db import Database
-from search_edit_dialog import SearchEditDialog
-from add_dish_dialog import AddDishDialog
+from db_worker import DatabaseWorker
+from dish_list_model import DishListModel
+from today_totals import TodayTotals
+
+# numpy и matplotlib нужны только для графика и импортируются при первом
+# построении (или заранее в фоне, см. warm_up_plotting). Диалоги и загрузчик
+# файлов тоже импортируются при первом открытии.
+PLOTTING_MODULES = ('numpy', 'matplotlib.figure', 'matplotlib.backends.backend_qt5agg', 'chart_figure',
+                    'chart_widget')
+
+CHART_BUCKETS = (
+    ("Автоматически", 'auto'),
+    ("По дням", 'day'),
+    ("По неделям", 'week'),
+    ("По месяцам", 'month'),
+)
+ROLLING_WINDOW_DAYS = 7
+
+
+class MainThreadDispatcher(QObject):
+    # Выполняет функции в потоке интерфейса: уведомления сервиса базы
+    # приходят из потока, который читает сокет
+    call = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.call.connect(self.run)
+
+    @pyqtSlot(object)
+    def run(self, callback):
+        callback()
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-import pandas as pd
 
 class CalorieApp(QWidget):
-    def __init__(self):
+    def __init__(self, warm_up_plotting=True, instrumentation=None, service_address=None):
         super().__init__()
         self.setWindowTitle("Калькулятор калорий")
         self.resize(1000, 1000)
 
-        self.db = Database()
+        if service_address:
+            # Запись идет через общий сервис базы (service.py), изменения
+            # других пользователей приходят от него уведомлениями
+            from service_client import ServiceDatabase
+
+            self.dispatcher = MainThreadDispatcher(self)
+            self.db = ServiceDatabase(service_address, dispatch=self.dispatcher.call.emit)
+        else:
+            self.db = Database()
+        # Необязательные замеры запросов (main.py --diagnostics)
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.attach(self.db)
+        self.diagnostics_dialog = None
+        startup.mark("открытие базы данных")
+        # Чтение выполняется в фоновом потоке, запись - через self.db
+        self.db_worker = DatabaseWorker(self, instrumentation)
+        self.db.add_dishes_listener(self.db_worker.dishes_changed)
+        self.db_worker.failed.connect(lambda _, message: QMessageBox.warning(self, "Ошибка", message))
+        self.db_worker.progress.connect(self.show_query_progress)
+        self.db_worker.idle.connect(self.hide_query_progress)
+        startup.mark("запуск фонового потока БД")
 
         layout = QVBoxLayout()
 
@@ -34,6 +85,13 @@ class CalorieApp(QWidget):
         check_kbju_button.clicked.connect(self.show_kbju_for_date)
         kbju_layout.addWidget(check_kbju_button)
 
+        # Блюда и граммы, которые закрывают остаток дневной нормы за эту дату
+        suggest_button = QPushButton('Подобрать блюда под дневную норму', self)
+        suggest_button.clicked.connect(self.open_suggest_dialog)
+        kbju_layout.addWidget(suggest_button)
+        # Норма, введенная в окне подбора, запоминается до закрытия приложения
+        self.daily_targets = None
+
         kbju_group.setLayout(kbju_layout)
         layout.addWidget(kbju_group)
 
@@ -54,9 +112,30 @@ class CalorieApp(QWidget):
 
         plot_button = QPushButton('Посмотреть динамику потребляемых калорий', self)
         plot_button.clicked.connect(self.plot_calories)
+        # Средние, скользящие средние, доли БЖУ и вклад блюд за выбранный период
+        stats_button = QPushButton('Статистика за период', self)
+        stats_button.clicked.connect(self.show_period_stats)
+
+        chart_options_layout = QHBoxLayout()
+        self.chart_bucket_input = QComboBox(self)
+        for label, bucket in CHART_BUCKETS:
+            self.chart_bucket_input.addItem(label, bucket)
+        self.chart_bucket_input.currentIndexChanged.connect(self.update_chart_options)
+        chart_options_layout.addWidget(QLabel("Группировка:"))
+        chart_options_layout.addWidget(self.chart_bucket_input)
+        self.chart_rolling_input = QCheckBox(f"Скользящее среднее за {ROLLING_WINDOW_DAYS} дней", self)
+        self.chart_rolling_input.toggled.connect(self.update_chart_options)
+        chart_options_layout.addWidget(self.chart_rolling_input)
 
         dynamic_plot_layout.addWidget(plot_button)
+        dynamic_plot_layout.addWidget(stats_button)
         dynamic_plot_layout.addLayout(date_layout)
+        dynamic_plot_layout.addLayout(chart_options_layout)
+        # Сам график создается при первом построении, чтобы не загружать
+        # matplotlib при запуске
+        self.chart_layout = QVBoxLayout()
+        dynamic_plot_layout.addLayout(self.chart_layout)
+        self.calorie_chart = None
 
         dynamic_plot_group.setLayout(dynamic_plot_layout)
         layout.addWidget(dynamic_plot_group)
@@ -67,7 +146,9 @@ class CalorieApp(QWidget):
         self.summary_label = QLabel("Ккал: 0\n"
                                      "Б: 0 г,\nЖ: 0 г,\nУ: 0 г\n", self)
         summary_layout.addWidget(self.summary_label)
-        self.update_today_summary()
+        # Суммы за сегодня держатся в памяти и обновляются без запросов к базе
+        self.today_totals = TodayTotals(self.db, self.db_worker, self)
+        self.today_totals.changed.connect(self.show_today_summary)
         summary_group.setLayout(summary_layout)
         layout.addWidget(summary_group)
 
@@ -82,8 +163,13 @@ class CalorieApp(QWidget):
         food_layout.addWidget(self.search_line)
 
         # Список для выбора блюда
-        self.dish_list = QListWidget(self)
-        self.populate_dish_list()
+        self.dish_model = DishListModel(self.db, self)
+        self.dish_list = QListView(self)
+        self.dish_list.setUniformItemSizes(True)
+        self.dish_list.setModel(self.dish_model)
+        if service_address:
+            # Блюда могли изменить в другом приложении
+            self.db.add_dishes_listener(lambda action, dish_id, name: self.populate_dish_list())
         food_layout.addWidget(QLabel("Выберите блюдо:"))
         food_layout.addWidget(self.dish_list)
 
@@ -103,6 +189,11 @@ class CalorieApp(QWidget):
         add_calories_button.clicked.connect(self.add_calories_from_dish)
         food_layout.addWidget(add_calories_button)
 
+        # Прием пищи из нескольких блюд и рецепты
+        meal_button = QPushButton('Прием пищи из нескольких блюд...', self)
+        meal_button.clicked.connect(self.open_meal_dialog)
+        food_layout.addWidget(meal_button)
+
         food_group.setLayout(food_layout)
         layout.addWidget(food_group)
 
@@ -116,12 +207,57 @@ class CalorieApp(QWidget):
         edit_dish_button.clicked.connect(self.open_search_edit_dialog)
         layout.addWidget(edit_dish_button)
 
+        # Загрузка справочника блюд или истории приемов пищи из файла
+        import_button = QPushButton('Импорт из файла (CSV/JSONL)', self)
+        import_button.clicked.connect(self.import_from_file)
+        layout.addWidget(import_button)
+
+        # Счетчики запросов к базе, если замеры включены
+        if instrumentation is not None:
+            diagnostics_button = QPushButton('Диагностика базы данных', self)
+            diagnostics_button.clicked.connect(self.open_diagnostics_dialog)
+            layout.addWidget(diagnostics_button)
+
+        # Индикатор долгих запросов к базе
+        self.query_progress = QProgressBar(self)
+        self.query_progress.setRange(0, 0)
+        self.query_progress.hide()
+        layout.addWidget(self.query_progress)
+
         self.setLayout(layout)
+        startup.mark("создание виджетов")
+
+        # Прогрев графических библиотек после того, как окно показано
+        if warm_up_plotting:
+            QTimer.singleShot(500, self.warm_up_plotting)
+
+    def warm_up_plotting(self):
+        def import_modules():
+            for module in PLOTTING_MODULES:
+                __import__(module)
+
+        threading.Thread(target=import_modules, name="PlottingWarmUp", daemon=True).start()
+
+    def closeEvent(self, event):
+        self.db_worker.stop()
+        self.db.close()
+        super().closeEvent(event)
+
+    def show_query_progress(self, key, elapsed_ms):
+        self.query_progress.setFormat(f"Загрузка данных... {elapsed_ms / 1000:.1f} с")
+        self.query_progress.show()
+
+    def hide_query_progress(self, key):
+        self.query_progress.hide()
 
     def show_kbju_for_date(self):
         selected_date = self.check_date_input.date().toString("yyyy-MM-dd")
-        total_calories, total_proteins, total_fats, total_carbs = self.db.get_data_by_date(selected_date)
-        
+        self.db_worker.submit('kbju_for_date', 'get_data_by_date', selected_date,
+                              callback=lambda data: self.show_kbju_message(selected_date, data))
+
+    def show_kbju_message(self, selected_date, data):
+        total_calories, total_proteins, total_fats, total_carbs = data
+
         result_message = (
             f"Потреблено за {selected_date}:\n"
             f"Калории: {total_calories:.2f} ккал\n"
@@ -132,28 +268,22 @@ class CalorieApp(QWidget):
 
         QMessageBox.information(self, "КБЖУ за выбранную дату", result_message)
 
-    def update_today_summary(self):
-        today_date = QDate.currentDate().toString("yyyy-MM-dd")
-        total_calories, total_proteins, total_fats, total_carbs = self.db.get_data_by_date(today_date)
+    def show_today_summary(self, data):
+        total_calories, total_proteins, total_fats, total_carbs = data
         self.summary_label.setText(
             f"Ккал: {total_calories:.2f}\n"
             f"Б: {total_proteins:.2f} г,\nЖ: {total_fats:.2f} г,\nУ: {total_carbs:.2f} г\n"
         )
 
     def populate_dish_list(self):
-        self.dish_list.clear()
-        dishes = self.db.get_dishes()
-        for dish in dishes:
-            name, _, _, _, _ = dish
-            self.dish_list.addItem(name)
+        self.filter_dish_list()
 
     def add_calories_from_dish(self):
-        selected_item = self.dish_list.currentItem()
-        if not selected_item:
+        dish_name = self.dish_model.name_at(self.dish_list.currentIndex())
+        if not dish_name:
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, выберите блюдо из списка.")
             return
 
-        dish_name = selected_item.text()
         grams_input = self.grams_input.text()
         try:
             grams = float(grams_input)
@@ -166,53 +296,121 @@ class CalorieApp(QWidget):
         date = self.date_input.date().toString("yyyy-MM-dd")
         total_calories = self.db.track_calories(dish_name, grams, date)
         QMessageBox.information(self, "Результат", f"{total_calories:.2f} ккал добавлено из {dish_name}.")
-        self.update_today_summary()
+
+    def open_meal_dialog(self):
+        from meal_dialog import MealDialog
+
+        dialog = MealDialog(self.date_input.date(), self)
+        dialog.exec_()
+        self.db_worker.cancel('meal_dialog_search')
+        # Могли появиться новые рецепты
+        self.populate_dish_list()
+
+    def open_suggest_dialog(self):
+        from suggest_dialog import SuggestDialog
+
+        dialog = SuggestDialog(self.check_date_input.date().toString("yyyy-MM-dd"), self.daily_targets, self)
+        dialog.exec_()
+        self.daily_targets = dialog.targets()
+        self.db_worker.cancel('suggest_dishes')
 
     def open_add_dish_dialog(self):
+        from add_dish_dialog import AddDishDialog
+
         dialog = AddDishDialog(self)
         dialog.exec_()
         self.populate_dish_list()
 
     def open_search_edit_dialog(self):
+        from search_edit_dialog import SearchEditDialog
+
         dialog = SearchEditDialog(self)
         dialog.exec_()
+        self.db_worker.cancel('edit_dialog_search')
+        self.populate_dish_list()
+
+    def open_diagnostics_dialog(self):
+        from diagnostics_dialog import DiagnosticsDialog
+
+        # Окно не модальное, чтобы смотреть счетчики во время работы
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self.instrumentation, self.db.cache_stats, self)
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+
+    def import_from_file(self):
+        from importer import BATCH_SIZE, IMPORTERS
+
+        kinds = {"Справочник блюд (name, kcal, proteins, fats, carbs)": 'dishes',
+                 "История приемов пищи (date, dish, grams)": 'log'}
+        kind, ok = QInputDialog.getItem(self, "Импорт", "Что загрузить:", list(kinds), 0, False)
+        if not ok:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Выберите файл", "", "Данные (*.csv *.jsonl *.ndjson)")
+        if not path:
+            return
+        rejects_path = path + '.rejected.csv'
+        self.db_worker.submit('import', IMPORTERS[kinds[kind]], path, None, BATCH_SIZE, rejects_path,
+                              callback=lambda report: self.show_import_report(report, rejects_path))
+
+    def show_import_report(self, report, rejects_path):
+        message = report.summary()
+        if report.rejected:
+            message += f"\nОтклоненные строки записаны в {rejects_path}"
+        QMessageBox.information(self, "Импорт завершен", message)
         self.populate_dish_list()
+        # Импорт идет через соединение фонового потока, его записи не видны подписчикам self.db
+        self.today_totals.reconcile()
 
     def plot_calories(self):
         start_date = self.start_date_input.date().toString("yyyy-MM-dd")
         end_date = self.end_date_input.date().toString("yyyy-MM-dd")
 
-        calorie_data = self.db.get_calorie_data_by_date_range(start_date, end_date)
+        self.db_worker.submit('plot_calories', 'get_calorie_data_by_date_range', start_date, end_date,
+                              callback=lambda data: self.show_calorie_plot(data, start_date, end_date))
+
+    def show_period_stats(self):
+        from period_stats import compute_period_stats
+
+        start_date = self.start_date_input.date().toString("yyyy-MM-dd")
+        end_date = self.end_date_input.date().toString("yyyy-MM-dd")
+        self.db_worker.submit('period_stats', compute_period_stats, start_date, end_date,
+                              callback=self.open_stats_dialog)
+
+    def open_stats_dialog(self, stats):
+        from stats_dialog import StatsDialog
+
+        StatsDialog(stats, self).exec_()
+
+    def show_calorie_plot(self, calorie_data, start_date, end_date):
         if not calorie_data:
             QMessageBox.warning(self, "Ошибка", "Нет данных за выбранный период.")
-            return
+        chart = self.get_calorie_chart()
+        chart.set_data(calorie_data, start_date, end_date)
 
-        df = pd.DataFrame(calorie_data, columns=["date", "total_kcal", "total_proteins", "total_fats", "total_carbs"])
+    def get_calorie_chart(self):
+        if self.calorie_chart is None:
+            from chart_widget import CalorieChart
 
-        sns.set_palette("Set2")
+            self.calorie_chart = CalorieChart(self)
+            self.calorie_chart.setMinimumHeight(350)
+            self.chart_layout.addWidget(self.calorie_chart)
+            self.update_chart_options()
+        return self.calorie_chart
 
-        plt.figure(figsize=(12, 6))
-        sns.lineplot(data=df, x="date", y="total_kcal", label="Калории", marker='o')
-        sns.lineplot(data=df, x="date", y="total_proteins", label="Белки", marker='o')
-        sns.lineplot(data=df, x="date", y="total_fats", label="Жиры", marker='o')
-        sns.lineplot(data=df, x="date", y="total_carbs", label="Углеводы", marker='o')
+    def update_chart_options(self):
+        if self.calorie_chart is None:
+            return
+        self.calorie_chart.set_options(self.chart_bucket_input.currentData(),
+                                       ROLLING_WINDOW_DAYS if self.chart_rolling_input.isChecked() else 0)
 
-        plt.title('Динамика потребляемых КБЖУ')
-        plt.xlabel('Дата')
-        plt.ylabel('Количество (г)')
-        plt.xticks(rotation=45)
-        plt.legend()
-        plt.tight_layout()
-        plt.show()
-    
     def filter_dish_list(self):
-            search_text = self.search_line.text().lower()
-            self.dish_list.clear()
-            dishes = self.db.get_dishes()
-            for dish in dishes:
-                name, _, _, _, _ = dish
-                if search_text in name.lower():
-                    self.dish_list.addItem(name)
+        search_text = self.search_line.text()
+        if not search_text.strip():
+            self.db_worker.cancel('dish_search')
+            self.dish_model.setMatches(None)
+            return
+        self.db_worker.submit('dish_search', 'search_dishes', search_text, callback=self.dish_model.setMatches)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+import os
+import sqlite3
+import stat
+from datetime import date, datetime
+
+# Закрытые годы журнала переносятся в отдельные файлы рядом с основной базой
+# (calories.2023.db и т.д.) и подключаются через ATTACH, когда чтение
+# затрагивает архивный период. Архив не меняется приложением: изменения блюд
+# и пересчет истории относятся только к записям основной базы.
+
+# SQLite по умолчанию позволяет подключить к соединению не больше 10 баз
+ATTACH_LIMIT = 8
+
+ARCHIVE_SCHEMA = (
+    # batch - номер переноса, в котором запись попала в архив
+    '''
+        CREATE TABLE IF NOT EXISTS {schema}.calorie_log (
+            id INTEGER PRIMARY KEY,
+            batch INTEGER NOT NULL,
+            dish_id INTEGER NOT NULL,
+            dish_name TEXT NOT NULL,
+            grams REAL NOT NULL,
+            calories REAL NOT NULL,
+            proteins REAL NOT NULL,
+            fats REAL NOT NULL,
+            carbs REAL NOT NULL,
+            date TEXT NOT NULL
+        )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_calorie_log_batch ON calorie_log(batch)',
+    'CREATE INDEX IF NOT EXISTS {schema}.idx_calorie_log_date ON calorie_log(date)',
+    '''
+        CREATE TABLE IF NOT EXISTS {schema}.daily_totals (
+            date TEXT NOT NULL,
+            batch INTEGER NOT NULL,
+            kcal REAL NOT NULL,
+            proteins REAL NOT NULL,
+            fats REAL NOT NULL,
+            carbs REAL NOT NULL,
+            PRIMARY KEY (date, batch)
+        ) WITHOUT ROWID
+    ''',
+)
+
+
+def archive_file_name(db_path, year):
+    stem, extension = os.path.splitext(os.path.basename(db_path))
+    return f'{stem}.{year}{extension or ".db"}'
+
+
+def _archive_path(config, file_name):
+    # Путь архива хранится относительно папки основной базы
+    return os.path.join(os.path.dirname(os.path.abspath(config.path)), file_name)
+
+
+def _year_bounds(year):
+    return f'{year:04d}-01-01', f'{year:04d}-12-31'
+
+
+def archive_year(db, year):
+    # Переносит записи журнала за закрытый год в архивный файл; возвращает
+    # число перенесенных записей. Перенос идет в два шага: копирование в
+    # архив и удаление из основной базы с записью в таблицу archives. После
+    # сбоя между шагами записи остаются в основной базе, а незавершенный
+    # перенос (batch больше записанного в archives) не читается и при
+    # повторном запуске удаляется из архива.
+    if db.config.path == ':memory:':
+        raise ValueError("База в памяти не архивируется")
+    if year >= date.today().year:
+        raise ValueError(f"{year} год еще не закончился")
+    start_date, end_date = _year_bounds(year)
+    connection = db.connection
+    rows = connection.execute('SELECT COUNT(*) FROM calorie_log WHERE date BETWEEN ? AND ?',
+                              (start_date, end_date)).fetchone()[0]
+    if not rows:
+        return 0
+
+    registered = connection.execute('SELECT file, batch FROM archives WHERE year = ?', (year,)).fetchone()
+    file_name, batch = registered or (archive_file_name(db.config.path, year), 0)
+    path = _archive_path(db.config, file_name)
+    if os.path.exists(path):
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+
+    schema = f'archive_{year}'
+    if schema in _attached(connection):
+        connection.execute(f'DETACH DATABASE {schema}')
+    connection.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+    try:
+        # Архив только читается, WAL ему не нужен
+        connection.execute(f'PRAGMA {schema}.journal_mode = DELETE')
+        for statement in ARCHIVE_SCHEMA:
+            connection.execute(statement.format(schema=schema))
+        with connection:
+            connection.execute(f'DELETE FROM {schema}.calorie_log WHERE batch > ?', (batch,))
+            connection.execute(f'DELETE FROM {schema}.daily_totals WHERE batch > ?', (batch,))
+            cursor = connection.execute(f'''
+                INSERT INTO {schema}.calorie_log
+                    (batch, dish_id, dish_name, grams, calories, proteins, fats, carbs, date)
+                SELECT ?, cl.dish_id, d.name, cl.grams, cl.calories, cl.proteins, cl.fats, cl.carbs, cl.date
+                FROM main.calorie_log cl
+                JOIN main.dishes d ON d.id = cl.dish_id
+                WHERE cl.date BETWEEN ? AND ?
+            ''', (batch + 1, start_date, end_date))
+            if cursor.rowcount != rows:
+                raise ValueError(f"Не все записи за {year} год скопированы в архив")
+            connection.execute(f'''
+                INSERT INTO {schema}.daily_totals (date, batch, kcal, proteins, fats, carbs)
+                SELECT date, batch, SUM(calories), SUM(proteins), SUM(fats), SUM(carbs)
+                FROM {schema}.calorie_log
+                WHERE batch = ?
+                GROUP BY date
+            ''', (batch + 1,))
+            archived_rows = connection.execute(f'SELECT COUNT(*) FROM {schema}.calorie_log').fetchone()[0]
+    finally:
+        connection.execute(f'DETACH DATABASE {schema}')
+
+    with connection:
+        connection.execute('DELETE FROM calorie_log WHERE date BETWEEN ? AND ?', (start_date, end_date))
+        connection.execute('DELETE FROM daily_totals WHERE date BETWEEN ? AND ?', (start_date, end_date))
+        # Вклад блюд за месяцы года считается заново, уже по архиву: в кэше
+        # остались id блюд, а id удаленного блюда может достаться новому
+        db._forget_monthly_stats([f'{year:04d}-{month:02d}-01' for month in range(1, 13)])
+        connection.execute('''
+            INSERT OR REPLACE INTO archives (year, file, rows, batch, archived_at) VALUES (?, ?, ?, ?, ?)
+        ''', (year, file_name, archived_rows, batch + 1, datetime.now().isoformat(timespec='seconds')))
+    _compact(path)
+    db._log_changed()
+    return rows
+
+
+def archive_closed_years(db, before=None, vacuum=True):
+    # Архивирует все годы раньше before (по умолчанию - раньше текущего);
+    # возвращает {год: число перенесенных записей}
+    before = before or date.today().year
+    cursor = db.connection.execute('''
+        SELECT DISTINCT CAST(substr(date, 1, 4) AS INTEGER) FROM calorie_log WHERE date < ? ORDER BY 1
+    ''', (_year_bounds(before)[0],))
+    result = {year: archive_year(db, year) for (year,) in cursor.fetchall()}
+    if result and vacuum:
+        # Освободившиеся страницы возвращаются файловой системе; в режиме WAL
+        # файл базы уменьшается только после переноса журнала в него
+        db.connection.execute('VACUUM')
+        db.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return result
+
+
+def _compact(path):
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute('VACUUM')
+    finally:
+        connection.close()
+    os.chmod(path, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+
+
+def _attached(connection):
+    return [row[1] for row in connection.execute('PRAGMA database_list')]
+
+
+def _attach(connection, config, year, file_name, keep=()):
+    # keep - архивы, которые нельзя отключать: они нужны тому же запросу
+    schema = f'archive_{year}'
+    attached = _attached(connection)
+    if schema in attached:
+        return schema
+    path = _archive_path(config, file_name)
+    # ATTACH несуществующего файла создал бы пустую базу
+    if not os.path.exists(path):
+        raise ValueError(f"Не найден архив за {year} год: {path}")
+    archives = [name for name in attached if name.startswith('archive_')]
+    if len(archives) >= ATTACH_LIMIT:
+        for name in archives:
+            if name not in keep:
+                connection.execute(f'DETACH DATABASE {name}')
+    connection.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+    return schema
+
+
+def _registered(connection, start_date, end_date):
+    cursor = connection.execute('SELECT year, file, batch FROM archives WHERE year BETWEEN ? AND ?',
+                                (int(start_date[:4]), int(end_date[:4])))
+    return cursor.fetchall()
+
+
+def attach_archives(connection, config, periods):
+    # Подключает архивы, пересекающиеся с периодами [(начало, конец)], для
+    # одного запроса; возвращает [(схема, batch)]. Вызывается вне транзакции.
+    archives = {}
+    for start_date, end_date in periods:
+        for year, file_name, batch in _registered(connection, start_date, end_date):
+            archives[year] = (file_name, batch)
+    if len(archives) > ATTACH_LIMIT:
+        raise ValueError(f"Запрос затрагивает больше {ATTACH_LIMIT} архивов")
+    keep = {f'archive_{year}' for year in archives}
+    return [(_attach(connection, config, year, file_name, keep), batch)
+            for year, (file_name, batch) in sorted(archives.items())]
+
+
+def archived_daily_totals(connection, config, start_date, end_date):
+    # Суммы КБЖУ по дням периода из архивов, которые с ним пересекаются. День
+    # встречается несколько раз, если год переносился в архив не один раз:
+    # такие строки складывает merge_daily_totals
+    rows = []
+    for year, file_name, batch in _registered(connection, start_date, end_date):
+        schema = _attach(connection, config, year, file_name)
+        rows.extend(connection.execute(f'''
+            SELECT date, kcal, proteins, fats, carbs
+            FROM {schema}.daily_totals
+            WHERE date BETWEEN ? AND ? AND batch <= ?
+        ''', (start_date, end_date, batch)))
+    return rows
+
+
+def merge_daily_totals(*sources):
+    # Складывает суммы по дням из нескольких источников (основная база и
+    # архивы: записи за архивный год могли быть добавлены и после переноса)
+    totals = {}
+    for rows in sources:
+        for day, *macros in rows:
+            current = totals.get(day)
+            totals[day] = tuple(macros) if current is None else tuple(a + b for a, b in zip(current, macros))
+    return [(day, *macros) for day, macros in sorted(totals.items())]
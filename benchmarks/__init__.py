@@ -0,0 +1,2 @@
+# Замеры производительности Database на синтетических данных.
+# Запуск: python -m benchmarks.run --help
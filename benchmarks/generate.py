@@ -0,0 +1,85 @@
+import os
+import random
+from datetime import date, timedelta
+
+from db import Database
+
+FOODS = (
+    'Гречка', 'Рис', 'Овсянка', 'Пшено', 'Булгур', 'Макароны', 'Картофель', 'Курица', 'Индейка', 'Говядина',
+    'Свинина', 'Лосось', 'Треска', 'Тунец', 'Креветки', 'Яйца', 'Творог', 'Сыр', 'Йогурт', 'Кефир',
+    'Молоко', 'Хлеб', 'Лаваш', 'Блины', 'Сырники', 'Омлет', 'Борщ', 'Щи', 'Солянка', 'Плов',
+    'Котлеты', 'Пельмени', 'Вареники', 'Голубцы', 'Салат', 'Капуста', 'Морковь', 'Свекла', 'Огурцы', 'Помидоры',
+    'Кабачки', 'Баклажаны', 'Фасоль', 'Чечевица', 'Нут', 'Яблоки', 'Бананы', 'Апельсины', 'Груши', 'Орехи',
+)
+STYLES = (
+    'отварной', 'жареный', 'тушеный', 'запеченный', 'на пару', 'на гриле', 'домашний', 'с овощами',
+    'с сыром', 'с грибами', 'по-деревенски', 'постный', 'диетический', 'острый', 'сливочный', 'с зеленью',
+)
+
+
+def dish_names(count, rng):
+    # Правдоподобные уникальные названия: сначала сочетания продукта и способа
+    # приготовления, дальше - с номером варианта
+    combos = [f'{food} {style}' for food in FOODS for style in STYLES]
+    rng.shuffle(combos)
+    for index in range(count):
+        name = combos[index % len(combos)]
+        if index >= len(combos):
+            name = f'{name} {index // len(combos) + 1}'
+        yield name
+
+
+def generate(path, dishes=2000, years=3, meals_per_day=5, seed=1, end_date=None):
+    # Создает базу по текущей схеме и заполняет ее блюдами и историей
+    # приемов пищи за years лет, заканчивающейся end_date (по умолчанию сегодня)
+    if os.path.exists(path):
+        raise ValueError(f"Файл уже существует: {path}")
+    rng = random.Random(seed)
+    db = Database(path)
+    connection = db.connection
+    with connection:
+        connection.executemany('''
+            INSERT INTO dishes (name, kcal, proteins, fats, carbs) VALUES (?, ?, ?, ?, ?)
+        ''', (
+            (name, round(rng.uniform(20, 600), 1), round(rng.uniform(0, 30), 1),
+             round(rng.uniform(0, 40), 1), round(rng.uniform(0, 80), 1))
+            for name in dish_names(dishes, rng)
+        ))
+    dishes = connection.execute('SELECT id, kcal, proteins, fats, carbs FROM dishes ORDER BY id').fetchall()
+    # Популярность блюд неравномерна: часть блюд едят гораздо чаще остальных
+    weights = [1 / (rank + 1) for rank in range(len(dishes))]
+
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=365 * years - 1)
+    with connection:
+        day = start_date
+        while day <= end_date:
+            meals = max(0, int(rng.gauss(meals_per_day, 1)))
+            day_text = day.isoformat()
+            entries = []
+            for dish_id, *nutrients in rng.choices(dishes, weights, k=meals):
+                grams = rng.randrange(30, 450, 10)
+                entries.append((dish_id, grams, *(grams * value / 100 for value in nutrients), day_text))
+            connection.executemany('''
+                INSERT INTO calorie_log (dish_id, grams, calories, proteins, fats, carbs, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', entries)
+            day += timedelta(days=1)
+    db.rebuild_daily_totals()
+    return db
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Синтетическая база для замеров")
+    parser.add_argument('path')
+    parser.add_argument('--dishes', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--meals-per-day', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    db = generate(args.path, args.dishes, args.years, args.meals_per_day, args.seed)
+    log_rows = db.connection.execute('SELECT COUNT(*) FROM calorie_log').fetchone()[0]
+    print(f"Блюд: {args.dishes}, записей в журнале: {log_rows}")
@@ -0,0 +1,155 @@
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from benchmarks.generate import generate
+from db import Database
+from storage import StorageConfig
+
+# Прежний режим: журнал отката, synchronous=FULL, у каждого потока свое
+# соединение (как у интерфейса и фонового потока), пула читателей нет
+CONFIGS = {
+    'legacy': dict(journal_mode='DELETE', synchronous='FULL', cache_size_kib=2000, mmap_size=0,
+                   statement_cache_size=128, reader_pool_size=0),
+    'wal_pool': dict(journal_mode='WAL', synchronous='NORMAL', reader_pool_size=4),
+}
+
+
+def _summary(durations, errors, seconds):
+    durations.sort()
+    return {
+        'operations': len(durations),
+        'errors': errors,
+        'per_second': len(durations) / seconds,
+        'median_ms': statistics.median(durations) if durations else None,
+        'p95_ms': durations[min(int(len(durations) * 0.95), len(durations) - 1)] if durations else None,
+        'max_ms': durations[-1] if durations else None,
+    }
+
+
+def run_config(path, settings, readers=4, seconds=5.0, seed=1):
+    config = StorageConfig(path=path, **settings)
+    writer_db = Database(config=config)
+    names = [row[0] for row in writer_db.connection.execute('SELECT name FROM dishes')]
+    first, last = writer_db.connection.execute('SELECT MIN(date), MAX(date) FROM daily_totals').fetchone()
+    first, last = date.fromisoformat(first), date.fromisoformat(last)
+    days = (last - first).days + 1
+    # С пулом все читатели работают с одним экземпляром Database,
+    # без пула - каждый со своим соединением
+    shared = writer_db if writer_db.readers is not None else None
+
+    stop = threading.Event()
+    start = threading.Barrier(readers + 2)
+    results = {'reads': [], 'writes': []}
+    errors = {'reads': 0, 'writes': 0}
+    lock = threading.Lock()
+
+    def reader(index):
+        rng = random.Random(seed + index)
+        db = shared or Database(config=config)
+        durations = []
+        failures = 0
+        start.wait()
+        while not stop.is_set():
+            day = first + timedelta(days=rng.randrange(days))
+            span = rng.choice((1, 30, 365))
+            started = time.perf_counter()
+            try:
+                if span == 1:
+                    db.get_data_by_date(day.isoformat())
+                else:
+                    db.get_calorie_data_by_date_range((day - timedelta(days=span - 1)).isoformat(), day.isoformat())
+            except sqlite3.OperationalError:
+                failures += 1
+                continue
+            durations.append((time.perf_counter() - started) * 1000)
+        with lock:
+            results['reads'].extend(durations)
+            errors['reads'] += failures
+        if db is not shared:
+            db.close()
+
+    def writer():
+        rng = random.Random(seed)
+        durations = []
+        failures = 0
+        start.wait()
+        while not stop.is_set():
+            day = first + timedelta(days=rng.randrange(days))
+            started = time.perf_counter()
+            try:
+                writer_db.track_calories(rng.choice(names), rng.randrange(30, 450, 10), day.isoformat())
+            except sqlite3.OperationalError:
+                failures += 1
+                continue
+            durations.append((time.perf_counter() - started) * 1000)
+        results['writes'].extend(durations)
+        errors['writes'] += failures
+
+    threads = [threading.Thread(target=reader, args=(index,)) for index in range(readers)]
+    for thread in threads:
+        thread.start()
+    # Писатель работает в потоке, открывшем соединение записи
+    timer = threading.Thread(target=lambda: (start.wait(), time.sleep(seconds), stop.set()))
+    timer.start()
+    writer()
+    timer.join()
+    for thread in threads:
+        thread.join()
+    writer_db.close()
+    return {kind: _summary(results[kind], errors[kind], seconds) for kind in ('reads', 'writes')}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Чтение и запись под смешанной нагрузкой: прежний режим и WAL с пулом")
+    parser.add_argument('--dishes', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--meals-per-day', type=int, default=5)
+    parser.add_argument('--readers', type=int, default=4, help="число потоков чтения")
+    parser.add_argument('--seconds', type=float, default=5.0, help="длительность каждого замера")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--configs', nargs='*', choices=sorted(CONFIGS), default=sorted(CONFIGS))
+    parser.add_argument('--output', help="куда записать результаты (JSON), по умолчанию stdout")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.configs:
+            path = os.path.join(directory, f'{name}.db')
+            generate(path, args.dishes, args.years, args.meals_per_day, args.seed).close()
+            results[name] = run_config(path, CONFIGS[name], args.readers, args.seconds, args.seed)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'readers': args.readers,
+            'seconds': args.seconds,
+            'generated': {'dishes': args.dishes, 'years': args.years, 'meals_per_day': args.meals_per_day,
+                          'seed': args.seed},
+        },
+        'configs': {name: CONFIGS[name] for name in args.configs},
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.generate import generate
+from db import Database
+from period_stats import compute_period_stats
+from storage import default_config
+
+# Во сколько раз медиана может вырасти относительно базового замера и на
+# сколько миллисекунд как минимум, чтобы считаться регрессией (быстрые
+# операции шумят сильнее, поэтому нужны оба порога)
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_MS = 0.05
+
+
+class Context:
+    def __init__(self, db, rng, names, start_date, end_date):
+        self.db = db
+        self.rng = rng
+        self.names = names
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def random_name(self):
+        return self.rng.choice(self.names)
+
+    def random_date(self):
+        offset = self.rng.randrange((self.end_date - self.start_date).days + 1)
+        return (self.start_date + timedelta(days=offset)).isoformat()
+
+
+# Каждый замер возвращает список пар (подготовка или None, вызов);
+# время подготовки не учитывается
+
+def _get_dishes(context, calls):
+    return [(None, context.db.get_dishes)] * max(calls // 10, 1)
+
+
+def _get_dish(context, calls):
+    return [(None, lambda name=context.random_name(): context.db.get_dish(name)) for _ in range(calls)]
+
+
+def _get_data_by_date(context, calls):
+    return [(None, lambda day=context.random_date(): context.db.get_data_by_date(day)) for _ in range(calls)]
+
+
+def _date_range(days):
+    def cases(context, calls):
+        result = []
+        for _ in range(calls):
+            end = date.fromisoformat(context.random_date())
+            start = max(end - timedelta(days=days - 1), context.start_date)
+            result.append((None, lambda start=start.isoformat(), end=end.isoformat():
+                           context.db.get_calorie_data_by_date_range(start, end)))
+        return result
+    return cases
+
+
+def _period_stats(days):
+    # Статистика за период; вклад блюд за закончившиеся месяцы считается
+    # при первом вызове и дальше берется из кэша в базе
+    def cases(context, calls):
+        result = []
+        for _ in range(max(calls // 10, 1)):
+            end = date.fromisoformat(context.random_date())
+            start = max(end - timedelta(days=days - 1), context.start_date)
+            result.append((None, lambda start=start.isoformat(), end=end.isoformat():
+                           compute_period_stats(context.db, start, end)))
+        return result
+    return cases
+
+
+def _search_typing(context, calls):
+    # Как filter_dish_list: текст поиска растет по одной букве
+    result = []
+    while len(result) < calls:
+        name = context.random_name().lower()
+        for length in range(1, len(name) + 1):
+            result.append((None, lambda text=name[:length]: context.db.search_dishes(text)))
+    return result[:calls]
+
+
+def _search_infix(context, calls):
+    # Поиск по части слова из середины названия
+    result = []
+    for _ in range(calls):
+        name = context.random_name().lower()
+        start = context.rng.randrange(max(len(name) - 3, 1))
+        result.append((None, lambda text=name[start:start + 4]: context.db.search_dishes(text)))
+    return result
+
+
+def _search_cold(context, calls):
+    # Первый поиск после запуска: загрузка каталога блюд в память
+    def reset():
+        context.db.search_dishes('')
+        context.db._dish_catalog.invalidate()
+    return [(reset, lambda: context.db.search_dishes('а'))] * max(calls // 20, 1)
+
+
+def _track_calories(context, calls):
+    return [(None, lambda name=context.random_name(), day=context.random_date():
+             context.db.track_calories(name, context.rng.randrange(30, 450, 10), day))
+            for _ in range(calls)]
+
+
+def _track_meal(context, calls):
+    # Прием пищи из пяти блюд одной транзакцией
+    return [(None, lambda items=[(context.random_name(), context.rng.randrange(30, 450, 10)) for _ in range(5)],
+             day=context.random_date(): context.db.track_meal(items, day))
+            for _ in range(calls)]
+
+
+def _update_dish(context, calls):
+    # Изменение КБЖУ: пересчитываются все дни, когда блюдо было съедено
+    result = []
+    for _ in range(max(calls // 10, 1)):
+        name = context.random_name()
+        kcal, proteins, fats, carbs = context.db.get_dish(name)
+        result.append((None, lambda name=name, kcal=kcal + 1, nutrients=(proteins, fats, carbs):
+                       context.db.update_dish(name, name, kcal, *nutrients)))
+    return result
+
+
+def _delete_dish(context, calls):
+    names = context.rng.sample(context.names, min(max(calls // 10, 1), len(context.names)))
+    return [(None, lambda name=name: context.db.delete_dish(name)) for name in names]
+
+
+# Изменяющие базу замеры идут последними, удаление - в самом конце
+BENCHMARKS = (
+    ('get_dishes', _get_dishes),
+    ('get_dish', _get_dish),
+    ('get_data_by_date', _get_data_by_date),
+    ('get_calorie_data_by_date_range/7d', _date_range(7)),
+    ('get_calorie_data_by_date_range/365d', _date_range(365)),
+    ('search_dishes/cold', _search_cold),
+    ('search_dishes/typing', _search_typing),
+    ('search_dishes/infix', _search_infix),
+    ('period_stats/365d', _period_stats(365)),
+    ('period_stats/1095d', _period_stats(1095)),
+    ('track_calories', _track_calories),
+    ('track_meal/5', _track_meal),
+    ('update_dish', _update_dish),
+    ('delete_dish', _delete_dish),
+)
+
+
+def measure(cases):
+    durations = []
+    for setup, call in cases:
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        call()
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return {
+        'calls': len(durations),
+        'min_ms': durations[0],
+        'median_ms': statistics.median(durations),
+        'p95_ms': durations[min(int(len(durations) * 0.95), len(durations) - 1)],
+        'max_ms': durations[-1],
+        'mean_ms': statistics.fmean(durations),
+    }
+
+
+def copy_database(path, directory):
+    # Замеры записывают в базу и удаляют блюда, поэтому готовая база
+    # копируется (вместе с архивами закрытых лет) и замеряется копия
+    if not os.path.isfile(path):
+        raise ValueError(f"Файл базы не найден: {path}")
+    copy = os.path.join(directory, os.path.basename(path))
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(copy)
+    try:
+        source.backup(target)
+        try:
+            archives = [row[0] for row in source.execute('SELECT file FROM archives')]
+        except sqlite3.OperationalError:
+            # База до появления архивов
+            archives = []
+    finally:
+        target.close()
+        source.close()
+    for file_name in archives:
+        archive = os.path.join(os.path.dirname(os.path.abspath(path)), file_name)
+        if os.path.exists(archive):
+            shutil.copyfile(archive, os.path.join(directory, file_name))
+    return copy
+
+
+def run(path, calls=200, seed=1, only=None, result_cache=False):
+    # По умолчанию замеряются сами запросы, без кэша результатов
+    config = default_config().replace(path=path)
+    if not result_cache:
+        config = config.replace(result_cache_entries=0)
+    db = Database(config=config)
+    names = [row[0] for row in db.connection.execute('SELECT name FROM dishes ORDER BY id')]
+    start_date, end_date = db.connection.execute('SELECT MIN(date), MAX(date) FROM daily_totals').fetchone()
+    if not names or start_date is None:
+        raise ValueError("В базе нет блюд или истории приемов пищи")
+    context = Context(db, random.Random(seed), names, date.fromisoformat(start_date), date.fromisoformat(end_date))
+
+    results = {}
+    for name, cases in BENCHMARKS:
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = measure(cases(context, calls))
+    db.close()
+    return results
+
+
+def compare(results, baseline, ratio=REGRESSION_RATIO, min_ms=REGRESSION_MIN_MS):
+    # Возвращает список (замер, было, стало) для замедлившихся операций
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            continue
+        old, new = before['median_ms'], result['median_ms']
+        if new > old * ratio and new - old > min_ms:
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Замеры производительности Database на синтетических данных")
+    parser.add_argument('--db', help="готовая база (замеряется ее копия); по умолчанию - временная синтетическая")
+    parser.add_argument('--dishes', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--meals-per-day', type=int, default=5)
+    parser.add_argument('--calls', type=int, default=200, help="число вызовов на замер")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', nargs='*', help="запустить только замеры с этими префиксами")
+    parser.add_argument('--output', help="куда записать результаты (JSON), по умолчанию stdout")
+    parser.add_argument('--compare', help="базовый JSON для поиска регрессий")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_RATIO)
+    parser.add_argument('--result-cache', action='store_true', help="включить кэш результатов чтения")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        generated = {}
+        if args.db is not None:
+            path = copy_database(args.db, directory)
+        else:
+            path = os.path.join(directory, 'benchmark.db')
+            started = time.perf_counter()
+            generate(path, args.dishes, args.years, args.meals_per_day, args.seed).close()
+            generated = {
+                'dishes': args.dishes,
+                'years': args.years,
+                'meals_per_day': args.meals_per_day,
+                'seed': args.seed,
+                'seconds': time.perf_counter() - started,
+            }
+        results = run(path, args.calls, args.seed, args.only, args.result_cache)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'calls': args.calls,
+            'result_cache': args.result_cache,
+            'database': args.db,
+            'generated': generated or None,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        baseline_data = dict(baseline.get('meta', {}).get('generated') or {}, seconds=None)
+        if generated and baseline_data != dict(generated, seconds=None):
+            print("Внимание: базовый замер сделан на других данных", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print(f"Регрессия {name}: {old:.3f} мс -> {new:.3f} мс", file=sys.stderr)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
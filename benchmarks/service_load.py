@@ -0,0 +1,199 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.generate import generate
+from benchmarks.mixed_load import _summary
+from db import Database
+from service import encode, parse_address
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Режимы нагрузки: много пользователей записывают приемы пищи в одну базу.
+# direct - как сейчас, у каждого процесса свое соединение записи;
+# service - через сервис базы с групповой фиксацией; service_serial - через
+# сервис, но каждая запись отдельной транзакцией (--max-batch 1)
+MODES = ('direct', 'service', 'service_serial')
+
+
+def _workload(path):
+    db = Database(path)
+    names = [row[0] for row in db.connection.execute('SELECT name FROM dishes')]
+    first, last = db.connection.execute('SELECT MIN(date), MAX(date) FROM daily_totals').fetchone()
+    db.close()
+    first = date.fromisoformat(first)
+    return names, first, (date.fromisoformat(last) - first).days + 1
+
+
+def _direct_logger(path, seed, seconds):
+    # Процесс-пользователь со своим соединением, как отдельное приложение
+    names, first, days = _workload(path)
+    rng = random.Random(seed)
+    db = Database(path)
+    durations = []
+    failures = 0
+    stop_at = time.perf_counter() + seconds
+    while time.perf_counter() < stop_at:
+        day = first + timedelta(days=rng.randrange(days))
+        started = time.perf_counter()
+        try:
+            db.track_calories(rng.choice(names), rng.randrange(30, 450, 10), day.isoformat())
+        except sqlite3.OperationalError:
+            failures += 1
+            continue
+        durations.append((time.perf_counter() - started) * 1000)
+    db.close()
+    return durations, failures
+
+
+def run_direct(path, loggers, seconds, seed):
+    with multiprocessing.Pool(loggers) as pool:
+        results = pool.starmap(_direct_logger, [(path, seed + index, seconds) for index in range(loggers)])
+    durations = [duration for result, _ in results for duration in result]
+    return {'writes': _summary(durations, sum(failures for _, failures in results), seconds)}
+
+
+async def _open(address):
+    target = parse_address(address)
+    if isinstance(target, tuple):
+        return await asyncio.open_connection(*target)
+    return await asyncio.open_unix_connection(target)
+
+
+async def _client(address, requests, stop_at, durations, counters):
+    # Клиент отправляет запрос и ждет ответа, как пользователь приложения;
+    # requests() возвращает (метод, параметры) следующего запроса
+    reader, writer = await _open(address)
+    request_id = 0
+    while time.perf_counter() < stop_at:
+        method, params = requests()
+        request_id += 1
+        started = time.perf_counter()
+        writer.write(encode({'id': request_id, 'method': method, 'params': params}))
+        response = json.loads(await reader.readline())
+        if 'error' in response:
+            counters['errors'] += 1
+            continue
+        durations.append((time.perf_counter() - started) * 1000)
+    writer.close()
+
+
+async def _service_load(address, path, loggers, readers, seconds, seed):
+    names, first, days = _workload(path)
+
+    def writes(rng):
+        def request():
+            day = first + timedelta(days=rng.randrange(days))
+            return 'track_calories', [rng.choice(names), rng.randrange(30, 450, 10), day.isoformat()]
+        return request
+
+    def reads(rng):
+        def request():
+            day = first + timedelta(days=rng.randrange(days))
+            span = rng.choice((1, 30, 365))
+            if span == 1:
+                return 'get_data_by_date', [day.isoformat()]
+            return 'get_calorie_data_by_date_range', [(day - timedelta(days=span - 1)).isoformat(), day.isoformat()]
+        return request
+
+    results = {'writes': [], 'reads': []}
+    counters = {'writes': {'errors': 0}, 'reads': {'errors': 0}}
+    stop_at = time.perf_counter() + seconds
+    clients = [_client(address, writes(random.Random(seed + index)), stop_at, results['writes'], counters['writes'])
+               for index in range(loggers)]
+    clients += [_client(address, reads(random.Random(-seed - index)), stop_at, results['reads'], counters['reads'])
+                for index in range(readers)]
+    await asyncio.gather(*clients)
+
+    reader, writer = await _open(address)
+    writer.write(encode({'id': 0, 'method': 'stats'}))
+    stats = json.loads(await reader.readline())['result']
+    writer.close()
+    report = {kind: _summary(results[kind], counters[kind]['errors'], seconds) for kind in results if results[kind]}
+    report['service'] = stats
+    report['writes_per_commit'] = stats['writes'] / max(stats['commits'], 1)
+    return report
+
+
+def run_service(path, loggers, readers, seconds, seed, max_batch=None, address=None):
+    address = address or os.path.join(os.path.dirname(path), 'service.sock')
+    command = [sys.executable, '-m', 'service', '--db', path, '--address', address]
+    if max_batch is not None:
+        command += ['--max-batch', str(max_batch)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    try:
+        # Сервис печатает строку, когда начинает принимать соединения
+        process.stdout.readline()
+        return asyncio.run(_service_load(address, path, loggers, readers, seconds, seed))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Много одновременных пользователей: запись напрямую и через сервис")
+    parser.add_argument('--dishes', type=int, default=2000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--meals-per-day', type=int, default=5)
+    parser.add_argument('--loggers', type=int, default=32, help="число пользователей, записывающих приемы пищи")
+    parser.add_argument('--readers', type=int, default=4, help="число клиентов чтения (для режимов сервиса)")
+    parser.add_argument('--seconds', type=float, default=5.0, help="длительность каждого замера")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--modes', nargs='*', choices=MODES, default=list(MODES))
+    parser.add_argument('--address', help="адрес уже запущенного сервиса (замер только режима service)")
+    parser.add_argument('--output', help="куда записать результаты (JSON), по умолчанию stdout")
+    args = parser.parse_args()
+
+    results = {}
+    if args.address:
+        # Внешний сервис: нагрузка на его базу, синтетическая база не создается
+        path = Database().config.path
+        results['service'] = asyncio.run(_service_load(args.address, path, args.loggers, args.readers,
+                                                       args.seconds, args.seed))
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            for mode in args.modes:
+                path = os.path.join(directory, f'{mode}.db')
+                generate(path, args.dishes, args.years, args.meals_per_day, args.seed).close()
+                if mode == 'direct':
+                    results[mode] = run_direct(path, args.loggers, args.seconds, args.seed)
+                else:
+                    results[mode] = run_service(path, args.loggers, args.readers, args.seconds, args.seed,
+                                                max_batch=1 if mode == 'service_serial' else None)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'loggers': args.loggers,
+            'readers': args.readers,
+            'seconds': args.seconds,
+            'generated': {'dishes': args.dishes, 'years': args.years, 'meals_per_day': args.meals_per_day,
+                          'seed': args.seed},
+        },
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import numpy as np
+from matplotlib import colormaps
+from matplotlib import dates as mdates
+from matplotlib.figure import Figure
+
+from period_stats import aggregate, rolling_mean
+
+SERIES = (
+    ('Калории', 0),
+    ('Белки', 1),
+    ('Жиры', 2),
+    ('Углеводы', 3),
+)
+
+BUCKET_LABELS = {
+    'day': "по дням",
+    'week': "среднее за день, по неделям",
+    'month': "среднее за день, по месяцам",
+}
+
+# Сколько точек на линии допустимо при автоматическом выборе агрегации
+MAX_POINTS = 120
+
+
+def choose_bucket(start, end):
+    days = int((np.datetime64(end, 'D') - np.datetime64(start, 'D')).astype(int)) + 1
+    if days <= MAX_POINTS:
+        return 'day'
+    if days <= MAX_POINTS * 7:
+        return 'week'
+    return 'month'
+
+
+class CalorieFigure:
+    # График КБЖУ без привязки к окну: фигура и линии создаются один раз,
+    # при новых данных меняются только координаты точек. В окне его
+    # показывает CalorieChart, в отчетах он сохраняется в файл через Agg.
+
+    def __init__(self):
+        # Поля заданы заранее: автоматическая раскладка (constrained/tight)
+        # пересчитывает размеры подписей при каждой отрисовке и занимает
+        # больше половины ее времени
+        self.figure = Figure(figsize=(8, 4))
+        self.figure.subplots_adjust(left=0.08, right=0.98, top=0.9, bottom=0.12)
+        self.axes = self.figure.add_subplot()
+        self.axes.set_title('Динамика потребляемых КБЖУ')
+        self.axes.set_xlabel('Дата')
+        self.axes.set_ylabel('Количество (г)')
+        self.axes.xaxis_date()
+        self.axes.xaxis.set_major_formatter(mdates.ConciseDateFormatter(self.axes.xaxis.get_major_locator()))
+
+        colors = colormaps['Set2'].colors
+        self.lines = [self.axes.plot([], [], marker='o', markersize=3, color=colors[i], label=label)[0]
+                      for label, i in SERIES]
+        self.rolling_lines = [self.axes.plot([], [], linestyle='--', linewidth=1, color=colors[i])[0]
+                              for _, i in SERIES]
+        self.axes.legend(loc='upper left')
+
+        self._dates = np.array([], dtype='datetime64[D]')
+        self._values = np.zeros((0, len(SERIES)))
+        self._range = None
+        self.bucket = 'auto'
+        self.rolling_window = 0
+        # Подпись перед заголовком (например, пользователь или месяц в отчете)
+        self.caption = None
+
+    def set_data(self, rows, start_date, end_date):
+        # rows - результат Database.get_calorie_data_by_date_range
+        if rows:
+            self._dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+            self._values = np.array([row[1:] for row in rows], dtype=float)
+        else:
+            self._dates = np.array([], dtype='datetime64[D]')
+            self._values = np.zeros((0, len(SERIES)))
+        self._range = (start_date, end_date)
+        self.redraw()
+
+    def set_options(self, bucket, rolling_window):
+        self.bucket = bucket
+        self.rolling_window = rolling_window
+        self.redraw()
+
+    def redraw(self):
+        if self._range is None:
+            return
+        bucket = choose_bucket(*self._range) if self.bucket == 'auto' else self.bucket
+        x, y = aggregate(self._dates, self._values, bucket)
+        x = mdates.date2num(x)
+        # Маркеры на тысячах точек не видны, но заметно замедляют отрисовку
+        marker = 'o' if len(x) <= MAX_POINTS else ''
+        for index, line in enumerate(self.lines):
+            line.set_data(x, y[:, index])
+            line.set_marker(marker)
+
+        if self.rolling_window:
+            rolling_x, rolling_y = rolling_mean(self._dates, self._values, self.rolling_window)
+            rolling_x = mdates.date2num(rolling_x)
+        for index, line in enumerate(self.rolling_lines):
+            line.set_visible(bool(self.rolling_window))
+            if self.rolling_window:
+                line.set_data(rolling_x, rolling_y[:, index])
+
+        title = f'Динамика потребляемых КБЖУ ({BUCKET_LABELS[bucket]})'
+        if self.caption:
+            title = f'{self.caption}. {title}'
+        if self.rolling_window:
+            title += f', пунктир - среднее за {self.rolling_window} дн.'
+        self.axes.set_title(title)
+        start, end = (mdates.date2num(np.datetime64(date, 'D')) for date in self._range)
+        self.axes.set_xlim(start - 0.5, end + 0.5)
+        self.axes.relim(visible_only=True)
+        self.axes.autoscale_view(scalex=False)
@@ -0,0 +1,26 @@
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from PyQt5.QtWidgets import QVBoxLayout, QWidget
+
+from chart_figure import CalorieFigure
+
+
+class CalorieChart(QWidget):
+    # График КБЖУ (chart_figure.CalorieFigure), встроенный в главное окно
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.chart = CalorieFigure()
+        self.canvas = FigureCanvasQTAgg(self.chart.figure)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.canvas)
+        self.setLayout(layout)
+
+    def set_data(self, rows, start_date, end_date):
+        self.chart.set_data(rows, start_date, end_date)
+        self.canvas.draw_idle()
+
+    def set_options(self, bucket, rolling_window):
+        self.chart.set_options(bucket, rolling_window)
+        self.canvas.draw_idle()
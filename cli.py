@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+# Работа с базой из командной строки без окна и PyQt5: запросы КБЖУ, импорт,
+# выгрузка, отчет за период и пакетная отрисовка графиков в PNG/SVG (Agg).
+# Файл базы задается --db или переменной CALORIES_DB, как в main.py.
+
+IMAGE_FORMATS = ('png', 'svg')
+RANGE_FIELDS = ('date', 'kcal', 'proteins', 'fats', 'carbs')
+
+# График процесса отрисовки: создается один раз на процесс пула и
+# переиспользуется для всех его заданий
+_figure = None
+
+
+def iso_date(value):
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Неверная дата: {value} (нужен формат ГГГГ-ММ-ДД)")
+
+
+def format_macros(kcal, proteins, fats, carbs):
+    return f"{kcal:.0f} ккал, Б {proteins:.1f} г, Ж {fats:.1f} г, У {carbs:.1f} г"
+
+
+def open_database(path=None):
+    from db import Database
+
+    return Database(path)
+
+
+def show_day(args):
+    db = open_database()
+    try:
+        print(f"{args.date}: {format_macros(*db.get_data_by_date(args.date))}")
+    finally:
+        db.close()
+
+
+def show_range(args):
+    db = open_database()
+    try:
+        rows = db.get_calorie_data_by_date_range(args.start, args.end)
+    finally:
+        db.close()
+    if args.json:
+        json.dump([dict(zip(RANGE_FIELDS, row)) for row in rows], sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    for day, *macros in rows:
+        print(f"{day}: {format_macros(*macros)}")
+    if not rows:
+        print("Нет записей за период")
+
+
+def show_dishes(args):
+    db = open_database()
+    try:
+        if args.search is None:
+            dishes = sorted(db.get_dishes())[:args.limit]
+        else:
+            dishes = [(name, *db.get_dish(name)) for name in db.search_dishes(args.search, args.limit)]
+    finally:
+        db.close()
+    for name, kcal, proteins, fats, carbs in dishes:
+        print(f"{name}: {format_macros(kcal, proteins, fats, carbs)} на 100 г")
+
+
+def import_file(args):
+    from importer import IMPORTERS
+
+    db = open_database()
+    try:
+        started = time.perf_counter()
+        report = IMPORTERS[args.kind](db, args.path, args.format, args.batch_size, args.rejects)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    print(report.summary())
+    print(f"Время: {elapsed:.2f} с")
+    for line_number, reason, row in report.rejects[:20]:
+        print(f"  строка {line_number}: {reason}")
+
+
+def export_rows(args):
+    from exporter import export_table
+
+    db = open_database()
+    try:
+        started = time.perf_counter()
+        rows = export_table(db, args.kind, args.output, args.format, args.start, args.end, args.chunk_size)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    print(f"Выгружено строк: {rows} в {args.output} ({elapsed:.2f} с, {rows / max(elapsed, 1e-9):.0f} строк/с)")
+
+
+def print_report(args):
+    from period_stats import compute_period_stats
+
+    db = open_database()
+    try:
+        stats = compute_period_stats(db, args.start, args.end, args.top)
+    finally:
+        db.close()
+    print(stats.summary())
+    if stats.dishes:
+        print("Вклад блюд в калорийность:")
+    for place, name, kcal, proteins, fats, carbs, grams, entries, share in stats.dishes:
+        print(f"{place:>3}. {name}: {kcal:.0f} ккал ({share or 0:.1%}), {grams:.0f} г, записей {entries}")
+
+
+def print_suggestions(args):
+    db = open_database()
+    try:
+        remaining, singles, pairs = db.suggest_dishes(args.date, args.targets, args.limit)
+    finally:
+        db.close()
+    print(f"Осталось до нормы за {args.date}: {format_macros(*(max(value, 0) for value in remaining))}")
+    for title, suggestions in (("Одно блюдо:", singles), ("Два блюда:", pairs)):
+        print(title)
+        for items, macros, error in suggestions:
+            dishes = ', '.join(f"{name} {grams:.0f} г" for name, grams in items)
+            print(f"  {dishes}: {format_macros(*macros)}, отклонение {(error / 4) ** 0.5:.1%}")
+
+
+def _render_chart(job):
+    # Задание пула: (строки, начало, конец, файл, подпись, агрегация, окно)
+    global _figure
+    rows, start_date, end_date, path, caption, bucket, rolling_window = job
+    if _figure is None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from chart_figure import CalorieFigure
+
+        _figure = CalorieFigure()
+        FigureCanvasAgg(_figure.figure)
+    _figure.caption = caption
+    _figure.bucket = bucket
+    _figure.rolling_window = rolling_window
+    _figure.set_data(rows, start_date, end_date)
+    _figure.figure.savefig(path)
+    return path
+
+
+def yearly_report_jobs(db_path, year, out_dir, image_format, bucket='auto', rolling_window=0):
+    # График за год и по графику на каждый месяц с записями. База читается
+    # один раз и закрывается до запуска пула: процессы получают готовые строки.
+    from period_stats import month_bounds
+
+    db = open_database(db_path)
+    try:
+        start_date, end_date = f'{year:04d}-01-01', f'{year:04d}-12-31'
+        rows = db.get_calorie_data_by_date_range(start_date, end_date)
+    finally:
+        db.close()
+    user = os.path.splitext(os.path.basename(db_path))[0]
+    folder = os.path.join(out_dir, user)
+    os.makedirs(folder, exist_ok=True)
+    jobs = [(rows, start_date, end_date, os.path.join(folder, f'{year:04d}.{image_format}'),
+             f'{user}, {year}', bucket, rolling_window)]
+    for number in range(1, 13):
+        month = f'{year:04d}-{number:02d}'
+        month_rows = [row for row in rows if row[0].startswith(month)]
+        if month_rows:
+            jobs.append((month_rows, *month_bounds(month), os.path.join(folder, f'{month}.{image_format}'),
+                         f'{user}, {month}', bucket, rolling_window))
+    return jobs
+
+
+def render_charts(jobs, processes=None):
+    # processes=1 - отрисовка в текущем процессе без пула
+    if processes == 1 or len(jobs) <= 1:
+        return [_render_chart(job) for job in jobs]
+    # Модули графика загружаются до запуска пула: при fork процессы
+    # получают их уже импортированными
+    import chart_figure  # noqa: F401
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_render_chart, jobs))
+
+
+def render_report(args):
+    from storage import default_config
+
+    if args.year > date.today().year:
+        raise ValueError(f"{args.year} год еще не начался")
+    started = time.perf_counter()
+    jobs = []
+    for db_path in args.users or [default_config().path]:
+        if not os.path.exists(db_path):
+            raise ValueError(f"Не найдена база: {db_path}")
+        jobs += yearly_report_jobs(db_path, args.year, args.out, args.format, args.bucket, args.rolling)
+    read_seconds = time.perf_counter() - started
+    paths = render_charts(jobs, args.jobs)
+    elapsed = time.perf_counter() - started
+    print(f"Графиков: {len(paths)} в {args.out} ({elapsed:.2f} с, из них чтение баз {read_seconds:.2f} с)")
+
+
+def build_parser():
+    from exporter import CHUNK_SIZE, EXPORTS, FORMATS
+    from importer import BATCH_SIZE, IMPORTERS
+    from meal_suggester import DEFAULT_TARGETS
+
+    parser = argparse.ArgumentParser(description="Калькулятор калорий из командной строки")
+    parser.add_argument('--db', help="файл базы данных (по умолчанию calories.db или переменная CALORIES_DB)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('day', help="КБЖУ за день")
+    command.add_argument('date', type=iso_date)
+    command.set_defaults(handler=show_day)
+
+    command = commands.add_parser('range', help="КБЖУ по дням за период")
+    command.add_argument('start', type=iso_date)
+    command.add_argument('end', type=iso_date)
+    command.add_argument('--json', action='store_true', help="вывести в JSON")
+    command.set_defaults(handler=show_range)
+
+    command = commands.add_parser('dishes', help="справочник блюд")
+    command.add_argument('--search', help="только блюда, название которых содержит текст")
+    command.add_argument('--limit', type=int)
+    command.set_defaults(handler=show_dishes)
+
+    command = commands.add_parser('import', help="загрузить блюда или историю из CSV/JSONL")
+    command.add_argument('kind', choices=sorted(IMPORTERS),
+                         help="dishes: name,kcal,proteins,fats,carbs; log: date,dish,grams")
+    command.add_argument('path')
+    command.add_argument('--format', choices=['csv', 'jsonl'], help="формат файла, по умолчанию по расширению")
+    command.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    command.add_argument('--rejects', help="куда записать отклоненные строки (CSV)")
+    command.set_defaults(handler=import_file)
+
+    command = commands.add_parser('export', help="выгрузить журнал, блюда или суммы по дням в CSV/JSONL/NumPy")
+    command.add_argument('kind', choices=sorted(EXPORTS),
+                         help="log: записи журнала; dishes: справочник блюд; daily: КБЖУ по дням")
+    command.add_argument('output', help="файл .csv, .jsonl, .npy или .npz")
+    command.add_argument('--format', choices=FORMATS, help="формат файла, по умолчанию по расширению")
+    command.add_argument('--start', type=iso_date, help="начало периода (для log и daily)")
+    command.add_argument('--end', type=iso_date, help="конец периода (для log и daily)")
+    command.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="строк за одно чтение из базы")
+    command.set_defaults(handler=export_rows)
+
+    command = commands.add_parser('report', help="статистика за период: средние, доли БЖУ, вклад блюд")
+    command.add_argument('start', type=iso_date)
+    command.add_argument('end', type=iso_date)
+    command.add_argument('--top', type=int, default=20, help="сколько блюд показать")
+    command.set_defaults(handler=print_report)
+
+    command = commands.add_parser('suggest', help="блюда и граммы под остаток дневной нормы КБЖУ")
+    command.add_argument('date', type=iso_date)
+    command.add_argument('--targets', type=float, nargs=4, default=DEFAULT_TARGETS,
+                         metavar=('KCAL', 'PROTEINS', 'FATS', 'CARBS'), help="дневная норма")
+    command.add_argument('--limit', type=int, help="сколько вариантов показать")
+    command.set_defaults(handler=print_suggestions)
+
+    command = commands.add_parser('render', help="графики за год и по месяцам в PNG/SVG")
+    command.add_argument('year', type=int)
+    command.add_argument('--users', nargs='+', metavar='DB',
+                         help="базы пользователей (по умолчанию --db); графики каждой - в своей папке")
+    command.add_argument('--out', default='reports', help="папка для графиков")
+    command.add_argument('--format', choices=IMAGE_FORMATS, default='png')
+    command.add_argument('--jobs', type=int, default=os.cpu_count(),
+                         help="число процессов отрисовки (1 - без пула)")
+    command.add_argument('--bucket', choices=['auto', 'day', 'week', 'month'], default='auto')
+    command.add_argument('--rolling', type=int, default=0, metavar='DAYS', help="скользящее среднее за DAYS дней")
+    command.set_defaults(handler=render_report)
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.db:
+        from storage import StorageConfig, set_default_config
+
+        set_default_config(StorageConfig.from_env(path=args.db))
+    try:
+        args.handler(args)
+    except ValueError as error:
+        print(f"Ошибка: {error}", file=sys.stderr)
+        raise SystemExit(1)
@@ -1,126 +1,536 @@
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime
 
-DB_FILE = 'calories.db'
+from archive import archive_closed_years, archived_daily_totals, merge_daily_totals
+from dish_catalog import DishCatalog
+from migrations import migrate
+from result_cache import shared_cache
+from storage import DB_FILE, ReaderPool, default_config
+
+# Суммы КБЖУ по журналу, сгруппированные по дням (для daily_totals).
+# КБЖУ каждой записи хранятся в журнале, поэтому соединение с dishes не нужно.
+DAILY_TOTALS_SELECT = '''
+    SELECT
+        cl.date AS date,
+        SUM(cl.calories) AS kcal,
+        SUM(cl.proteins) AS proteins,
+        SUM(cl.fats) AS fats,
+        SUM(cl.carbs) AS carbs
+    FROM calorie_log cl
+'''
 
 class Database:
-    def __init__(self):
-        self.connection = sqlite3.connect(DB_FILE)
+    def __init__(self, path=None, config=None):
+        config = config or default_config()
+        if path is not None:
+            config = config.replace(path=path)
+        self.config = config
+        # Через self.connection идет запись; чтение - через пул соединений
+        # только для чтения, если он включен (см. storage.StorageConfig)
+        self.connection = config.connect()
+        self._dishes_listeners = []
+        self._log_listeners = []
+        self._dish_catalog = None
+        self._meal_suggester = None
         self.create_tables()
+        self.readers = ReaderPool(config) if config.reader_pool_size else None
+        # Кэш КБЖУ по дням и диапазонам, общий для всех экземпляров с этим файлом;
+        # методы записи сбрасывают в нем только затронутые дни
+        self.cache = None
+        if config.result_cache_entries:
+            self.cache = shared_cache(config.path, config.result_cache_entries, config.result_cache_bytes)
 
     def create_tables(self):
-        with self.connection:
-            self.connection.execute('''
-                CREATE TABLE IF NOT EXISTS dishes (
-                    id INTEGER PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    kcal REAL NOT NULL,
-                    proteins REAL NOT NULL,
-                    fats REAL NOT NULL,
-                    carbs REAL NOT NULL
-                )
-            ''')
-            self.connection.execute('''
-                CREATE TABLE IF NOT EXISTS calorie_log (
-                    id INTEGER PRIMARY KEY,
-                    dish_name TEXT NOT NULL,
-                    grams INTEGER NOT NULL,
-                    calories REAL NOT NULL,
-                    date TEXT NOT NULL,
-                    FOREIGN KEY(dish_name) REFERENCES dishes(name)
-                )
-            ''')
+        migrate(self.connection)
+
+    @contextmanager
+    def _reading(self):
+        if self.readers is None:
+            yield self.connection
+        else:
+            with self.readers.connection() as connection:
+                yield connection
+
+    def _cached(self, key, query, *args):
+        if self.cache is None:
+            return query(*args)
+        found, result = self.cache.get(key)
+        if not found:
+            version = self.cache.version
+            result = query(*args)
+            self.cache.put(key, result, version)
+        # Список отдаем копией, чтобы вызывающий код не испортил кэш
+        return list(result) if isinstance(result, list) else result
+
+    def _log_changed(self, dates=None, macros=None):
+        # Вызывается после изменения журнала за эти дни (None - за все дни):
+        # сбрасывает кэш и сообщает подписчикам
+        if self.cache is not None:
+            if dates is None:
+                self.cache.clear()
+            else:
+                self.cache.invalidate_dates(dates)
+        for callback in self._log_listeners:
+            callback(dates, macros)
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def close(self):
+        if self.readers is not None:
+            self.readers.close()
+        self.connection.close()
+
+    def add_dishes_listener(self, callback):
+        # callback(action, dish_id, name) вызывается после изменения таблицы dishes;
+        # action - 'added', 'updated', 'deleted' или 'reset' (без id и названия)
+        self._dishes_listeners.append(callback)
+
+    def add_log_listener(self, callback):
+        # callback(dates, macros) вызывается после изменения журнала приемов пищи
+        # через это соединение; dates - список дней или None (все дни), macros -
+        # прибавка КБЖУ за единственный день из dates, если она известна, иначе None
+        self._log_listeners.append(callback)
+
+    def _notify_dishes_changed(self, action, dish_id=None, name=None):
+        for callback in self._dishes_listeners:
+            callback(action, dish_id, name)
 
     def add_dish(self, name, kcal, proteins, fats, carbs):
         try:
             with self.connection:
-                self.connection.execute('''
+                cursor = self.connection.execute('''
                     INSERT INTO dishes (name, kcal, proteins, fats, carbs)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (name, kcal, proteins, fats, carbs))
         except sqlite3.IntegrityError:
             raise ValueError("Блюдо уже существует")
+        self._notify_dishes_changed('added', cursor.lastrowid, name)
 
     def get_dishes(self):
-        cursor = self.connection.execute('SELECT name, kcal, proteins, fats, carbs FROM dishes')
-        return cursor.fetchall()
+        with self._reading() as connection:
+            cursor = connection.execute('SELECT name, kcal, proteins, fats, carbs FROM dishes')
+            return cursor.fetchall()
+
+    def search_dishes(self, text, limit=None):
+        # Каталог блюд в памяти создается при первом поиске
+        if self._dish_catalog is None:
+            self._dish_catalog = DishCatalog(self)
+        return self._dish_catalog.search(text, limit)
+
+    def suggest_dishes(self, date, targets, limit=None):
+        # Блюда и пары блюд, которые лучше всего закрывают остаток дневной
+        # нормы targets (ккал, Б, Ж, У) за date; возвращает (остаток, блюда,
+        # пары), см. meal_suggester.MealSuggester.suggest. numpy загружается
+        # при первом подборе, матрица блюд тоже создается при нем.
+        from meal_suggester import SUGGESTIONS, MealSuggester
+
+        if self._meal_suggester is None:
+            self._meal_suggester = MealSuggester(self)
+        remaining = tuple(target - eaten for target, eaten in zip(targets, self.get_data_by_date(date)))
+        return (remaining, *self._meal_suggester.suggest(remaining, targets, limit or SUGGESTIONS))
 
     def get_dish(self, name):
-        cursor = self.connection.execute('SELECT kcal, proteins, fats, carbs FROM dishes WHERE name = ?', (name,))
-        return cursor.fetchone()
+        with self._reading() as connection:
+            cursor = connection.execute('SELECT kcal, proteins, fats, carbs FROM dishes WHERE name = ?', (name,))
+            return cursor.fetchone()
     
     def update_dish(self, old_name, name, kcal, proteins, fats, carbs):
-        with self.connection:
-            self.connection.execute('''
-                UPDATE dishes SET name = ?, kcal = ?, proteins = ?, fats = ?, carbs = ? WHERE name = ?
-            ''', (name, kcal, proteins, fats, carbs, old_name))
+        cursor = self.connection.execute('''
+            SELECT id, kcal, proteins, fats, carbs FROM dishes WHERE name = ?
+        ''', (old_name,))
+        dish = cursor.fetchone()
+        if dish is None:
+            return
+        dish_id = dish[0]
+        recipes = []
+        # История приемов пищи не меняется: КБЖУ записей зафиксированы при
+        # добавлении (пересчитать их можно через recalculate_history)
+        try:
+            with self.connection:
+                self.connection.execute('''
+                    UPDATE dishes SET name = ?, kcal = ?, proteins = ?, fats = ?, carbs = ? WHERE id = ?
+                ''', (name, kcal, proteins, fats, carbs, dish_id))
+                # Рецепты с этим блюдом в составе пересчитываются
+                if tuple(dish[1:]) != (kcal, proteins, fats, carbs):
+                    recipes = self._recompute_recipes(self._recipes_containing([dish_id]))
+        except sqlite3.IntegrityError:
+            raise ValueError("Блюдо уже существует")
+        self._notify_dishes_changed('updated', dish_id, name)
+        for recipe_id, recipe_name in recipes:
+            self._notify_dishes_changed('updated', recipe_id, recipe_name)
 
     def track_calories(self, dish_name, grams, date):
-        dish = self.get_dish(dish_name)
+        cursor = self.connection.execute('''
+            SELECT id, kcal, proteins, fats, carbs FROM dishes WHERE name = ?
+        ''', (dish_name,))
+        dish = cursor.fetchone()
         if dish:
-            kcal_per_100g = dish[0]
+            dish_id, kcal_per_100g, proteins, fats, carbs = dish
             total_calories = (kcal_per_100g / 100) * grams
+            macros = (total_calories, grams * (proteins / 100), grams * (fats / 100), grams * (carbs / 100))
 
             with self.connection:
                 self.connection.execute('''
-                    INSERT INTO calorie_log (dish_name, grams, calories, date) VALUES (?, ?, ?, ?)
-                ''', (dish_name, grams, total_calories, date))
+                    INSERT INTO calorie_log (dish_id, grams, calories, proteins, fats, carbs, date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (dish_id, grams, *macros, date))
+                self._add_daily_totals(date, macros)
+            self._log_changed([date], macros)
 
             return total_calories
         return 0
 
+    def track_meal(self, items, date):
+        # Записывает прием пищи из нескольких блюд одной транзакцией;
+        # items - список (название блюда, граммы). Возвращает сумму ккал.
+        dishes = self._find_dishes(items)
+        entries = []
+        totals = [0, 0, 0, 0]
+        for name, grams in items:
+            dish_id, *per_100g = dishes[name]
+            macros = [grams * (value / 100) for value in per_100g]
+            entries.append((dish_id, grams, *macros, date))
+            totals = [total + value for total, value in zip(totals, macros)]
+
+        with self.connection:
+            self.connection.executemany('''
+                INSERT INTO calorie_log (dish_id, grams, calories, proteins, fats, carbs, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', entries)
+            self._add_daily_totals(date, totals)
+        self._log_changed([date], tuple(totals))
+        return totals[0]
+
+    def track_meals(self, meals):
+        # Несколько приемов пищи [(items, date)] одной транзакцией (групповая
+        # фиксация записей разных клиентов в service.py); возвращает сумму ккал
+        # каждого. Если хоть одно блюдо не найдено, не записывается ничего.
+        dishes = self._find_dishes([item for items, _ in meals for item in items])
+        entries = []
+        calories = []
+        day_totals = {}
+        for items, date in meals:
+            totals = day_totals.setdefault(date, [0, 0, 0, 0])
+            meal_calories = 0
+            for name, grams in items:
+                dish_id, *per_100g = dishes[name]
+                macros = [grams * (value / 100) for value in per_100g]
+                entries.append((dish_id, grams, *macros, date))
+                totals[:] = [total + value for total, value in zip(totals, macros)]
+                meal_calories += macros[0]
+            calories.append(meal_calories)
+
+        with self.connection:
+            self.connection.executemany('''
+                INSERT INTO calorie_log (dish_id, grams, calories, proteins, fats, carbs, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', entries)
+            for date, totals in day_totals.items():
+                self._add_daily_totals(date, totals)
+        for date, totals in day_totals.items():
+            self._log_changed([date], tuple(totals))
+        return calories
+
+    def save_recipe(self, name, items):
+        # Сохраняет прием пищи как рецепт: новое блюдо с КБЖУ на 100 г,
+        # посчитанными по составу, которое записывается одной строкой журнала
+        name = name.strip()
+        if not name:
+            raise ValueError("Введите название рецепта")
+        dishes = self._find_dishes(items)
+        total_grams = sum(grams for _, grams in items)
+        per_100g = [
+            sum(grams * dishes[dish_name][index] for dish_name, grams in items) / total_grams
+            for index in range(1, 5)
+        ]
+        try:
+            with self.connection:
+                cursor = self.connection.execute('''
+                    INSERT INTO dishes (name, kcal, proteins, fats, carbs) VALUES (?, ?, ?, ?, ?)
+                ''', (name, *per_100g))
+                recipe_id = cursor.lastrowid
+                self.connection.executemany('''
+                    INSERT INTO recipe_items (recipe_id, dish_id, grams) VALUES (?, ?, ?)
+                ''', [(recipe_id, dishes[dish_name][0], grams) for dish_name, grams in items])
+        except sqlite3.IntegrityError:
+            raise ValueError("Блюдо уже существует")
+        self._notify_dishes_changed('added', recipe_id, name)
+        return tuple(per_100g)
+
+    def get_recipe_items(self, name):
+        # Состав рецепта: список (название блюда, граммы); пустой, если это не рецепт
+        cursor = self.connection.execute('''
+            SELECT d.name, ri.grams
+            FROM recipe_items ri
+            JOIN dishes r ON r.id = ri.recipe_id
+            JOIN dishes d ON d.id = ri.dish_id
+            WHERE r.name = ?
+            ORDER BY ri.id
+        ''', (name,))
+        return cursor.fetchall()
+
+    def _find_dishes(self, items):
+        # {название: (id, ккал, белки, жиры, углеводы)} для блюд из items
+        if not items:
+            raise ValueError("Не выбрано ни одного блюда")
+        for _, grams in items:
+            if not 0 < grams < float('inf'):
+                raise ValueError("Введите корректное количество граммов.")
+        names = sorted({name for name, _ in items})
+        dishes = {}
+        # Не больше 500 параметров в одном запросе
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor = self.connection.execute(f'''
+                SELECT name, id, kcal, proteins, fats, carbs FROM dishes WHERE name IN ({placeholders})
+            ''', chunk)
+            dishes.update((row[0], row[1:]) for row in cursor)
+        missing = [name for name in names if name not in dishes]
+        if missing:
+            raise ValueError(f"Блюдо не найдено: {', '.join(missing)}")
+        return dishes
+
+    def _add_daily_totals(self, date, macros):
+        # Прибавляет КБЖУ к сумме за день; вызывается внутри транзакции
+        self._forget_monthly_stats([date])
+        self.connection.execute('''
+            INSERT INTO daily_totals (date, kcal, proteins, fats, carbs) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(date) DO UPDATE SET
+                kcal = kcal + excluded.kcal,
+                proteins = proteins + excluded.proteins,
+                fats = fats + excluded.fats,
+                carbs = carbs + excluded.carbs
+        ''', (date, *macros))
+
+    def _forget_monthly_stats(self, dates=None):
+        # Сбрасывает вклад блюд, сохраненный для закончившихся месяцев с этими
+        # днями (dates=None - за все месяцы); вызывается внутри транзакции
+        if dates is None:
+            self.connection.execute('DELETE FROM monthly_dish_totals')
+            self.connection.execute('DELETE FROM monthly_stats')
+            return
+        # Текущий месяц не кэшируется, записи за сегодня проходят без запросов
+        current_month = datetime.now().strftime('%Y-%m')
+        months = [(month,) for month in {date[:7] for date in dates} if month < current_month]
+        if months:
+            self.connection.executemany('DELETE FROM monthly_dish_totals WHERE month = ?', months)
+            self.connection.executemany('DELETE FROM monthly_stats WHERE month = ?', months)
+
     def get_data_by_date(self, date):
-        cursor = self.connection.execute("""
-            SELECT 
-                SUM(grams * (d.kcal / 100)) AS total_kcal,
-                SUM(grams * (d.proteins / 100)) AS total_proteins,
-                SUM(grams * (d.fats / 100)) AS total_fats,
-                SUM(grams * (d.carbs / 100)) AS total_carbs
-            FROM 
-                calorie_log cl
-            JOIN 
-                dishes d ON cl.dish_name = d.name
-            WHERE 
-                cl.date = ?
-        """, (date,))
-
-        result = cursor.fetchone()
-        total_kcal = result[0] if result[0] is not None else 0
-        total_proteins = result[1] if result[1] is not None else 0
-        total_fats = result[2] if result[2] is not None else 0
-        total_carbs = result[3] if result[3] is not None else 0
+        return self._cached(('day', date), self._query_data_by_date, date)
+
+    def _query_data_by_date(self, date):
+        with self._reading() as connection:
+            cursor = connection.execute("""
+                SELECT kcal, proteins, fats, carbs FROM daily_totals WHERE date = ?
+            """, (date,))
+            result = cursor.fetchone()
+            # День закрытого года может быть в архиве (см. archive.py)
+            archived = archived_daily_totals(connection, self.config, date, date)
+        if archived:
+            result = merge_daily_totals([(date, *result)] if result else [], archived)[0][1:]
+
+        if result is None:
+            return 0, 0, 0, 0
+        total_kcal, total_proteins, total_fats, total_carbs = result
 
         return total_kcal, total_proteins, total_fats, total_carbs
     
     def delete_dish(self, dish_name):
+        cursor = self.connection.execute('SELECT id FROM dishes WHERE name = ?', (dish_name,))
+        dish = cursor.fetchone()
+        if dish is None:
+            return
+        dish_id = dish[0]
         with self.connection:
+            dates = self._get_dish_dates(dish_id)
+            # Блюдо убирается из состава рецептов, а если это рецепт - удаляется его состав
+            recipe_ids = self._recipes_containing([dish_id])
+            self.connection.execute('''
+                DELETE FROM recipe_items WHERE dish_id = ? OR recipe_id = ?
+            ''', (dish_id, dish_id))
             # Удаление записей из calorie_log, связанных с блюдом
             self.connection.execute('''
-                DELETE FROM calorie_log WHERE dish_name = ?
-            ''', (dish_name,))
+                DELETE FROM calorie_log WHERE dish_id = ?
+            ''', (dish_id,))
             # Удаление блюда из dishes
             self.connection.execute('''
-                DELETE FROM dishes WHERE name = ?
-            ''', (dish_name,))
+                DELETE FROM dishes WHERE id = ?
+            ''', (dish_id,))
+            self._refresh_daily_totals(dates)
+            recipes = self._recompute_recipes(recipe_ids)
+        self._log_changed(dates)
+        self._notify_dishes_changed('deleted', dish_id, dish_name)
+        for recipe_id, recipe_name in recipes:
+            self._notify_dishes_changed('updated', recipe_id, recipe_name)
 
     def get_calorie_data_by_date_range(self, start_date, end_date):
-        cursor = self.connection.execute("""
-            SELECT 
-                cl.date,
-                SUM(cl.grams * (d.kcal / 100)) AS total_kcal,
-                SUM(cl.grams * (d.proteins / 100)) AS total_proteins,
-                SUM(cl.grams * (d.fats / 100)) AS total_fats,
-                SUM(cl.grams * (d.carbs / 100)) AS total_carbs
-            FROM 
-                calorie_log cl
-            JOIN 
-                dishes d ON cl.dish_name = d.name
-            WHERE 
-                cl.date BETWEEN ? AND ?
-            GROUP BY 
-                cl.date
-            ORDER BY 
-                cl.date
-        """, (start_date, end_date))
+        return self._cached(('range', start_date, end_date), self._query_calorie_data_by_date_range,
+                            start_date, end_date)
 
-        return cursor.fetchall()
+    def _query_calorie_data_by_date_range(self, start_date, end_date):
+        with self._reading() as connection:
+            cursor = connection.execute("""
+                SELECT date, kcal, proteins, fats, carbs
+                FROM daily_totals
+                WHERE date BETWEEN ? AND ?
+                ORDER BY date
+            """, (start_date, end_date))
+            rows = cursor.fetchall()
+            archived = archived_daily_totals(connection, self.config, start_date, end_date)
+        if archived:
+            return merge_daily_totals(rows, archived)
+        return rows
+
+    def _refresh_daily_totals(self, dates):
+        # Пересчет сумм за указанные дни по журналу; вызывается внутри транзакции
+        self._forget_monthly_stats(dates)
+        params = [(date,) for date in dates]
+        self.connection.executemany('DELETE FROM daily_totals WHERE date = ?', params)
+        self.connection.executemany(f"""
+            INSERT INTO daily_totals (date, kcal, proteins, fats, carbs)
+            {DAILY_TOTALS_SELECT}
+            WHERE cl.date = ?
+            GROUP BY cl.date
+        """, params)
+
+    def recalculate_history(self, dish_name=None):
+        # Пересчитывает КБЖУ записей журнала по текущим значениям блюда
+        # (или всех блюд, если dish_name не указан); возвращает число записей
+        if dish_name is None:
+            condition, params = '', ()
+        else:
+            dish = self.connection.execute('SELECT id FROM dishes WHERE name = ?', (dish_name,)).fetchone()
+            if dish is None:
+                raise ValueError("Блюдо не найдено")
+            condition, params = 'WHERE dish_id = ?', (dish[0],)
+        with self.connection:
+            cursor = self.connection.execute(f'''
+                UPDATE calorie_log SET (calories, proteins, fats, carbs) = (
+                    SELECT
+                        calorie_log.grams * (d.kcal / 100),
+                        calorie_log.grams * (d.proteins / 100),
+                        calorie_log.grams * (d.fats / 100),
+                        calorie_log.grams * (d.carbs / 100)
+                    FROM dishes d
+                    WHERE d.id = calorie_log.dish_id
+                )
+                {condition}
+            ''', params)
+            updated = cursor.rowcount
+            if dish_name is None:
+                self._rebuild_daily_totals()
+                dates = None
+            else:
+                dates = self._get_dish_dates(params[0])
+                self._refresh_daily_totals(dates)
+        self._log_changed(dates)
+        return updated
+
+    def _recipes_containing(self, dish_ids):
+        recipe_ids = set()
+        for dish_id in dish_ids:
+            cursor = self.connection.execute('SELECT recipe_id FROM recipe_items WHERE dish_id = ?', (dish_id,))
+            recipe_ids.update(row[0] for row in cursor)
+        return recipe_ids
+
+    def _recompute_recipes(self, recipe_ids):
+        # Пересчет КБЖУ на 100 г рецептов по их составу, а затем рецептов,
+        # в которые входят они сами; вызывается внутри транзакции.
+        # Рецепт без состава сохраняет последние значения. Возвращает
+        # [(id, название)] пересчитанных рецептов: после фиксации о них нужно
+        # сообщить подписчикам (каталог блюд, матрица подбора)
+        seen = set()
+        pending = set(recipe_ids)
+        while pending:
+            self.connection.executemany('''
+                UPDATE dishes SET (kcal, proteins, fats, carbs) = (
+                    SELECT
+                        SUM(ri.grams * d.kcal) / SUM(ri.grams),
+                        SUM(ri.grams * d.proteins) / SUM(ri.grams),
+                        SUM(ri.grams * d.fats) / SUM(ri.grams),
+                        SUM(ri.grams * d.carbs) / SUM(ri.grams)
+                    FROM recipe_items ri
+                    JOIN dishes d ON d.id = ri.dish_id
+                    WHERE ri.recipe_id = dishes.id
+                )
+                WHERE id = ? AND EXISTS (SELECT 1 FROM recipe_items WHERE recipe_id = dishes.id)
+            ''', [(recipe_id,) for recipe_id in pending])
+            seen.update(pending)
+            pending = self._recipes_containing(pending) - seen
+        recipes = []
+        for recipe_id in seen:
+            row = self.connection.execute('SELECT id, name FROM dishes WHERE id = ?', (recipe_id,)).fetchone()
+            if row is not None:
+                recipes.append(row)
+        return recipes
+
+    def _get_dish_dates(self, dish_id):
+        cursor = self.connection.execute('SELECT DISTINCT date FROM calorie_log WHERE dish_id = ?', (dish_id,))
+        return [row[0] for row in cursor]
+
+    def rebuild_daily_totals(self):
+        with self.connection:
+            self._rebuild_daily_totals()
+        self._log_changed()
+
+    def _rebuild_daily_totals(self):
+        self._forget_monthly_stats()
+        self.connection.execute('DELETE FROM daily_totals')
+        self.connection.execute(f"""
+            INSERT INTO daily_totals (date, kcal, proteins, fats, carbs)
+            {DAILY_TOTALS_SELECT}
+            GROUP BY cl.date
+        """)
+
+    def verify_daily_totals(self, tolerance=1e-6):
+        # Возвращает список дат, для которых сохраненные суммы расходятся с журналом
+        cursor = self.connection.execute(f"""
+            WITH expected AS (
+                {DAILY_TOTALS_SELECT}
+                GROUP BY cl.date
+            )
+            SELECT e.date
+            FROM expected e
+            LEFT JOIN daily_totals t ON t.date = e.date
+            WHERE t.date IS NULL
+                OR ABS(e.kcal - t.kcal) > :tol OR ABS(e.proteins - t.proteins) > :tol
+                OR ABS(e.fats - t.fats) > :tol OR ABS(e.carbs - t.carbs) > :tol
+            UNION
+            SELECT t.date FROM daily_totals t WHERE t.date NOT IN (SELECT date FROM expected)
+            ORDER BY 1
+        """, {'tol': tolerance})
+        return [row[0] for row in cursor]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Обслуживание таблицы daily_totals и истории приемов пищи")
+    parser.add_argument('command', choices=['rebuild-totals', 'verify-totals', 'recalculate-history', 'archive'])
+    parser.add_argument('--dish', help="для recalculate-history: пересчитать только это блюдо")
+    parser.add_argument('--before', type=int, help="для archive: архивировать годы раньше этого (по умолчанию текущего)")
+    args = parser.parse_args()
+
+    db = Database()
+    if args.command == 'rebuild-totals':
+        db.rebuild_daily_totals()
+        print("Суммы по дням пересчитаны")
+    elif args.command == 'recalculate-history':
+        updated = db.recalculate_history(args.dish)
+        print(f"Пересчитано записей: {updated}")
+    elif args.command == 'archive':
+        archived = archive_closed_years(db, args.before)
+        for year, rows in archived.items():
+            print(f"{year}: перенесено записей: {rows}")
+        if not archived:
+            print("Нет записей за закрытые годы")
+    else:
+        mismatched = db.verify_daily_totals()
+        if mismatched:
+            print(f"Расхождения за {len(mismatched)} дн.: {', '.join(mismatched[:20])}")
+            raise SystemExit(1)
+        print("Расхождений нет")
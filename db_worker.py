@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from db import Database
+from storage import default_config
+
+
+class DatabaseWorker(QObject):
+    # Выполняет запросы к базе в отдельном потоке со своим соединением.
+    # Результаты возвращаются в поток интерфейса через сигналы Qt.
+    # Каждый запрос имеет ключ: новый запрос с тем же ключом отменяет
+    # предыдущий (например, поиск по устаревшему тексту).
+
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+    # Ключ долгого запроса и сколько миллисекунд он уже выполняется
+    progress = pyqtSignal(str, int)
+    idle = pyqtSignal(str)
+
+    # Через сколько миллисекунд запрос считается долгим и как часто сообщать о нем
+    PROGRESS_DELAY_MS = 200
+    PROGRESS_INTERVAL_MS = 100
+
+    def __init__(self, parent=None, instrumentation=None):
+        super().__init__(parent)
+        self._instrumentation = instrumentation
+        self._queue = queue.Queue()
+        self._callbacks = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._next_ticket = 0
+        self._current = None
+        self.finished.connect(self._deliver)
+        self.failed.connect(self._deliver_error)
+        self._thread = threading.Thread(target=self._run, name="DatabaseWorker", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, method, *args, callback=None, errback=None):
+        # Ставит в очередь вызов Database.<method>(*args) или, если method -
+        # функция, method(db, *args); callback(result) будет вызван в потоке
+        # интерфейса, если запрос не устареет раньше
+        with self._lock:
+            self._next_ticket += 1
+            ticket = self._next_ticket
+            self._generations[key] = ticket
+            self._callbacks[ticket] = (key, callback, errback)
+        self._queue.put((ticket, key, method, args))
+        return ticket
+
+    def cancel(self, key):
+        with self._lock:
+            self._generations.pop(key, None)
+
+    def dishes_changed(self, action, dish_id=None, name=None):
+        # Передает уведомление об изменении блюд соединению потока, чтобы
+        # его каталог блюд обновился раньше следующих поисковых запросов
+        self._queue.put((None, None, '_notify_dishes_changed', (action, dish_id, name)))
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _is_stale(self, ticket, key):
+        with self._lock:
+            return self._generations.get(key) != ticket
+
+    def _run(self):
+        # Поток сам по себе отдельный читатель, пул соединений ему не нужен
+        db = Database(config=default_config().replace(reader_pool_size=0))
+        if self._instrumentation is not None:
+            self._instrumentation.attach(db)
+        db.connection.set_progress_handler(self._on_sqlite_progress, 10000)
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            ticket, key, method, args = task
+            if ticket is None:
+                getattr(db, method)(*args)
+                continue
+            if self._is_stale(ticket, key):
+                self._discard(ticket)
+                continue
+
+            self._current = (ticket, key, time.monotonic(), [0])
+            try:
+                if callable(method):
+                    result = method(db, *args)
+                else:
+                    result = getattr(db, method)(*args)
+            except Exception as e:
+                if self._is_stale(ticket, key):
+                    self._discard(ticket)
+                else:
+                    self.failed.emit(ticket, str(e))
+            else:
+                if self._is_stale(ticket, key):
+                    self._discard(ticket)
+                else:
+                    self.finished.emit(ticket, result)
+            finally:
+                reported = self._current[3][0]
+                self._current = None
+                if reported:
+                    self.idle.emit(key)
+        db.close()
+
+    def _on_sqlite_progress(self):
+        current = self._current
+        if current is None:
+            return 0
+        ticket, key, started, reported = current
+        # Ненулевой результат прерывает выполнение устаревшего запроса
+        if self._is_stale(ticket, key):
+            return 1
+        elapsed = int((time.monotonic() - started) * 1000)
+        if elapsed >= self.PROGRESS_DELAY_MS and elapsed - reported[0] >= self.PROGRESS_INTERVAL_MS:
+            reported[0] = elapsed
+            self.progress.emit(key, elapsed)
+        return 0
+
+    def _discard(self, ticket):
+        with self._lock:
+            self._callbacks.pop(ticket, None)
+
+    def _take_callbacks(self, ticket):
+        # Результат мог устареть, пока сигнал шел в поток интерфейса
+        with self._lock:
+            key, callback, errback = self._callbacks.pop(ticket, (None, None, None))
+            if self._generations.get(key) != ticket:
+                return None, None
+            del self._generations[key]
+        return callback, errback
+
+    def _deliver(self, ticket, result):
+        callback, _ = self._take_callbacks(ticket)
+        if callback is not None:
+            callback(result)
+
+    def _deliver_error(self, ticket, message):
+        _, errback = self._take_callbacks(ticket)
+        if errback is not None:
+            errback(message)
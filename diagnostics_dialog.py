@@ -0,0 +1,85 @@
+from datetime import datetime
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton,
+                             QLabel, QListWidget, QHeaderView)
+
+COLUMNS = ("Метод", "Вызовов", "Ошибок", "Строк", "Запросов", "Среднее, мс", "p50, мс", "p95, мс", "Макс, мс")
+
+
+class DiagnosticsDialog(QDialog):
+    # Живые счетчики Instrumentation: таблица по методам Database и
+    # последние медленные запросы с планом выполнения; cache_stats -
+    # функция, возвращающая статистику кэша результатов (Database.cache_stats)
+
+    REFRESH_MS = 1000
+
+    def __init__(self, instrumentation, cache_stats=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Диагностика базы данных")
+        self.resize(900, 600)
+        self.instrumentation = instrumentation
+        self.cache_stats = cache_stats
+
+        layout = QVBoxLayout()
+
+        self.table = QTableWidget(0, len(COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        layout.addWidget(self.table)
+
+        self.cache_label = QLabel(self)
+        layout.addWidget(self.cache_label)
+
+        layout.addWidget(QLabel(f"Медленные запросы (от {instrumentation.slow_query_ms} мс):"))
+        self.slow_list = QListWidget(self)
+        layout.addWidget(self.slow_list)
+
+        buttons_layout = QHBoxLayout()
+        reset_button = QPushButton("Сбросить счетчики", self)
+        reset_button.clicked.connect(self.reset)
+        buttons_layout.addWidget(reset_button)
+        close_button = QPushButton("Закрыть", self)
+        close_button.clicked.connect(self.close)
+        buttons_layout.addWidget(close_button)
+        layout.addLayout(buttons_layout)
+
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(self.REFRESH_MS)
+        self.refresh()
+
+    def refresh(self):
+        methods, slow_queries = self.instrumentation.snapshot()
+        self.table.setRowCount(len(methods))
+        for row, (name, stats) in enumerate(sorted(methods.items(), key=lambda item: -item[1].total_ms)):
+            values = (name, stats.calls, stats.errors, stats.rows, stats.statements, f"{stats.mean_ms():.2f}",
+                      f"{stats.percentile_ms(0.5):.2f}", f"{stats.percentile_ms(0.95):.2f}", f"{stats.max_ms:.2f}")
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(str(value)))
+
+        stats = self.cache_stats() if self.cache_stats is not None else None
+        if stats is None:
+            self.cache_label.setText("Кэш результатов выключен")
+        else:
+            self.cache_label.setText(
+                f"Кэш результатов: {stats['entries']} записей, {stats['bytes'] / 1024:.0f} КиБ; "
+                f"попаданий {stats['hits']}, промахов {stats['misses']} ({stats['hit_ratio']:.0%}), "
+                f"вытеснено {stats['evictions']}, сброшено {stats['invalidations']}"
+            )
+
+        self.slow_list.clear()
+        for slow_query in reversed(slow_queries):
+            moment = datetime.fromtimestamp(slow_query.moment).strftime('%H:%M:%S')
+            text = f"{moment}  {slow_query.elapsed_ms:.1f} мс  {slow_query.method}: {slow_query.sql.strip()}"
+            if slow_query.plan:
+                text += '\n' + '\n'.join(f'    {line}' for line in slow_query.plan)
+            self.slow_list.addItem(text)
+
+    def reset(self):
+        self.instrumentation.reset()
+        self.refresh()
@@ -0,0 +1,172 @@
+import heapq
+from array import array
+from bisect import bisect_left, insort
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class DishCatalog:
+    # Кэш названий блюд в памяти для поиска по подстроке.
+    # Префиксные совпадения ищутся двоичным поиском по отсортированному списку,
+    # вхождения в середине названия - по индексу триграмм, который строится
+    # при первом таком запросе. Кэш обновляется инкрементально по уведомлениям
+    # Database об изменении таблицы dishes.
+
+    def __init__(self, db):
+        self.db = db
+        self._loaded = False
+        db.add_dishes_listener(self._on_dishes_changed)
+
+    def _load(self):
+        cursor = self.db.connection.execute('SELECT id, name FROM dishes')
+        # Слоты - позиции в _names/_lowered, на них ссылается индекс триграмм
+        self._names = []
+        self._lowered = []
+        self._slots = {}
+        self._sorted = []
+        self._postings = None
+        for dish_id, name in cursor:
+            self._append(dish_id, name)
+        self._sorted.sort()
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load()
+
+    def _append(self, dish_id, name):
+        slot = len(self._names)
+        lowered = name.lower()
+        self._names.append(name)
+        self._lowered.append(lowered)
+        self._slots[dish_id] = slot
+        self._sorted.append((lowered, name))
+        if self._postings is not None:
+            self._index_slot(slot, lowered)
+        return slot
+
+    def _index_slot(self, slot, lowered):
+        postings = self._postings
+        for gram in _trigrams(lowered):
+            slots = postings.get(gram)
+            if slots is None:
+                slots = postings[gram] = array('I')
+            slots.append(slot)
+
+    def _build_index(self):
+        self._postings = {}
+        for slot, lowered in enumerate(self._lowered):
+            if lowered is not None:
+                self._index_slot(slot, lowered)
+
+    def _insert(self, dish_id, name):
+        slot = self._append(dish_id, name)
+        # _append добавил элемент в конец, переносим его на место по порядку
+        item = self._sorted.pop()
+        insort(self._sorted, item)
+        return slot
+
+    def _remove(self, dish_id):
+        # Слот остается в индексе триграмм пустым до следующей полной загрузки
+        slot = self._slots.pop(dish_id, None)
+        if slot is None:
+            return
+        item = (self._lowered[slot], self._names[slot])
+        position = bisect_left(self._sorted, item)
+        if position < len(self._sorted) and self._sorted[position] == item:
+            del self._sorted[position]
+        self._names[slot] = None
+        self._lowered[slot] = None
+
+    def _on_dishes_changed(self, action, dish_id=None, name=None):
+        if not self._loaded:
+            return
+        if action == 'reset':
+            self._loaded = False
+            return
+        if action in ('updated', 'deleted'):
+            self._remove(dish_id)
+        if action in ('added', 'updated'):
+            self._insert(dish_id, name)
+        # Слишком много пустых слотов - перечитываем каталог при следующем обращении
+        if len(self._names) > 2 * len(self._slots) + 1024:
+            self._loaded = False
+
+    def invalidate(self):
+        self._loaded = False
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._slots)
+
+    def names(self):
+        self._ensure_loaded()
+        return [name for _, name in self._sorted]
+
+    def _prefix_matches(self, query):
+        entries = self._sorted
+        position = bisect_left(entries, (query,))
+        while position < len(entries) and entries[position][0].startswith(query):
+            yield entries[position]
+            position += 1
+
+    def _infix_candidates(self, query):
+        if len(query) < 3:
+            return range(len(self._lowered))
+        if self._postings is None:
+            self._build_index()
+        shortest = None
+        for gram in _trigrams(query):
+            slots = self._postings.get(gram)
+            if slots is None:
+                return ()
+            if shortest is None or len(slots) < len(shortest):
+                shortest = slots
+        return shortest
+
+    def search(self, text, limit=None):
+        # Возвращает названия блюд, содержащие text, в порядке релевантности:
+        # точное совпадение, начало названия, начало слова, вхождение в середине.
+        # Внутри одной группы названия упорядочены по алфавиту.
+        self._ensure_loaded()
+        query = text.strip().lower()
+        if not query:
+            names = self.names()
+            return names if limit is None else names[:limit]
+
+        exact = []
+        prefix = []
+        for lowered, name in self._prefix_matches(query):
+            if lowered == query:
+                exact.append(name)
+            else:
+                prefix.append(name)
+                if limit is not None and len(exact) + len(prefix) >= limit:
+                    return (exact + prefix)[:limit]
+
+        word_start = []
+        inside = []
+        for slot in self._infix_candidates(query):
+            lowered = self._lowered[slot]
+            if lowered is None:
+                continue
+            position = lowered.find(query, 1)
+            if position < 0 or lowered.startswith(query):
+                continue
+            if lowered[position - 1].isalnum():
+                inside.append((lowered, self._names[slot]))
+            else:
+                word_start.append((lowered, self._names[slot]))
+
+        result = exact + prefix
+        for group in (word_start, inside):
+            if limit is None:
+                group.sort()
+            else:
+                group = heapq.nsmallest(limit - len(result), group)
+            result.extend(name for _, name in group)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
@@ -0,0 +1,79 @@
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+
+
+class DishListModel(QAbstractListModel):
+    # Список названий блюд для QListView, строки подгружаются порциями по мере
+    # прокрутки (canFetchMore/fetchMore). Без фильтра строки читаются из SQLite
+    # постранично по индексу названий, с фильтром - из готового списка
+    # найденных блюд (см. Database.search_dishes).
+
+    PAGE_SIZE = 256
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._rows = []
+        self._matches = None
+        self._exhausted = False
+        self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        return self._rows[index.row()]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        if self._matches is not None:
+            return len(self._rows) < len(self._matches)
+        return not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        if self._matches is not None:
+            page = self._matches[len(self._rows):len(self._rows) + self.PAGE_SIZE]
+        else:
+            page = self._fetch_page()
+            self._exhausted = len(page) < self.PAGE_SIZE
+        if not page:
+            return
+        self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+        self._rows.extend(page)
+        self.endInsertRows()
+
+    def _fetch_page(self):
+        if self._rows:
+            cursor = self.db.connection.execute('''
+                SELECT name FROM dishes WHERE name > ? ORDER BY name LIMIT ?
+            ''', (self._rows[-1], self.PAGE_SIZE))
+        else:
+            cursor = self.db.connection.execute('''
+                SELECT name FROM dishes ORDER BY name LIMIT ?
+            ''', (self.PAGE_SIZE,))
+        return [row[0] for row in cursor]
+
+    def setMatches(self, matches):
+        # matches - найденные названия блюд или None, чтобы показать все блюда
+        self._matches = matches
+        self.refresh()
+
+    def refresh(self):
+        # Сбрасывает загруженные строки и сразу загружает первую порцию,
+        # остальные представление запросит при прокрутке
+        self.beginResetModel()
+        self._rows = []
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+
+    def name_at(self, index):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        return self._rows[index.row()]
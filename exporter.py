@@ -0,0 +1,230 @@
+import csv
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from archive import attach_archives
+
+# Сколько строк читается из курсора за раз: память выгрузки зависит от
+# этого числа, а не от размера истории
+CHUNK_SIZE = 50000
+FORMATS = ('csv', 'jsonl', 'npy', 'npz')
+# Период по умолчанию - вся история
+FIRST_DATE = '0001-01-01'
+LAST_DATE = '9999-12-31'
+
+# Столбцы выгрузки и их типы в файлах NumPy; 'U' - строка, ширина которой
+# берется по самому длинному значению
+LOG_COLUMNS = (
+    ('date', 'datetime64[D]'),
+    ('dish_id', 'i8'),
+    ('grams', 'f8'),
+    ('calories', 'f8'),
+    ('proteins', 'f8'),
+    ('fats', 'f8'),
+    ('carbs', 'f8'),
+)
+DISH_COLUMNS = (
+    ('id', 'i8'),
+    ('name', 'U'),
+    ('kcal', 'f8'),
+    ('proteins', 'f8'),
+    ('fats', 'f8'),
+    ('carbs', 'f8'),
+)
+DAILY_COLUMNS = (
+    ('date', 'datetime64[D]'),
+    ('kcal', 'f8'),
+    ('proteins', 'f8'),
+    ('fats', 'f8'),
+    ('carbs', 'f8'),
+)
+
+
+def _log_query(connection, config, start_date, end_date):
+    # Записи журнала: сначала архивы закрытых лет, затем основная база
+    archives = attach_archives(connection, config, [(start_date, end_date)])
+    parts = [f'''
+        SELECT date, dish_id, grams, calories, proteins, fats, carbs
+        FROM {schema}.calorie_log
+        WHERE date BETWEEN ? AND ? AND batch <= {int(batch)}
+    ''' for schema, batch in archives]
+    # Всю историю быстрее прочитать просмотром таблицы: через индекс дат
+    # за каждой строкой пришлось бы отдельно обращаться к таблице
+    hint = ' NOT INDEXED' if (start_date, end_date) == (FIRST_DATE, LAST_DATE) else ''
+    parts.append(f'''
+        SELECT date, dish_id, grams, calories, proteins, fats, carbs
+        FROM main.calorie_log{hint}
+        WHERE date BETWEEN ? AND ?
+    ''')
+    return ' UNION ALL '.join(parts), (start_date, end_date) * len(parts)
+
+
+def _dishes_query(connection, config, start_date, end_date):
+    return 'SELECT id, name, kcal, proteins, fats, carbs FROM main.dishes ORDER BY id', ()
+
+
+def _daily_query(connection, config, start_date, end_date):
+    archives = attach_archives(connection, config, [(start_date, end_date)])
+    query = 'SELECT date, kcal, proteins, fats, carbs FROM main.daily_totals WHERE date BETWEEN ? AND ?'
+    if not archives:
+        return query + ' ORDER BY date', (start_date, end_date)
+    # День архивного года может быть и в основной базе, и в нескольких
+    # переносах архива
+    parts = [query] + [f'''
+        SELECT date, kcal, proteins, fats, carbs
+        FROM {schema}.daily_totals
+        WHERE date BETWEEN ? AND ? AND batch <= {int(batch)}
+    ''' for schema, batch in archives]
+    return f'''
+        SELECT date, SUM(kcal), SUM(proteins), SUM(fats), SUM(carbs)
+        FROM ({' UNION ALL '.join(parts)})
+        GROUP BY date
+        ORDER BY date
+    ''', (start_date, end_date) * len(parts)
+
+
+EXPORTS = {
+    'log': (LOG_COLUMNS, _log_query),
+    'dishes': (DISH_COLUMNS, _dishes_query),
+    'daily': (DAILY_COLUMNS, _daily_query),
+}
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension == 'ndjson':
+        return 'jsonl'
+    if extension in FORMATS:
+        return extension
+    raise ValueError(f"Неизвестный формат файла: {path}")
+
+
+def _chunks(cursor, size):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def _write_csv(path, columns, chunks):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow([name for name, _ in columns])
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def _write_jsonl(path, columns, chunks):
+    names = [name for name, _ in columns]
+    count = 0
+    with open(path, 'w', encoding='utf-8') as file:
+        for rows in chunks:
+            file.write(''.join(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in rows))
+            count += len(rows)
+    return count
+
+
+def _npy_dtype(connection, columns, query, params):
+    fields = []
+    for name, kind in columns:
+        if kind == 'U':
+            width = connection.execute(f'SELECT MAX(LENGTH({name})) FROM ({query})', params).fetchone()[0]
+            kind = f'U{width or 1}'
+        fields.append((name, kind))
+    return np.dtype(fields)
+
+
+def _write_npy_header(file, dtype, count):
+    # Заголовок .npy пишется до данных, поэтому число строк считается заранее
+    np.lib.format.write_array_header_1_0(file, {
+        'descr': np.lib.format.dtype_to_descr(dtype),
+        'fortran_order': False,
+        'shape': (count,),
+    })
+
+
+def _write_npy(path, dtype, count, chunks):
+    # Один массив записей со всеми столбцами
+    written = 0
+    with open(path, 'wb') as file:
+        _write_npy_header(file, dtype, count)
+        for rows in chunks:
+            written += len(rows)
+            if written > count:
+                raise ValueError("Число строк изменилось во время выгрузки")
+            file.write(np.array(rows, dtype=dtype).tobytes())
+    return written
+
+
+def _write_npz(path, dtype, count, chunks):
+    # По массиву на столбец (np.load(path)['kcal']). Столбцы сначала пишутся
+    # в отдельные .npy во временной папке, затем складываются в архив без сжатия.
+    directory = tempfile.mkdtemp(prefix='.export-', dir=os.path.dirname(os.path.abspath(path)))
+    paths = {name: os.path.join(directory, f'{name}.npy') for name in dtype.names}
+    files = {}
+    written = 0
+    try:
+        for name, column_path in paths.items():
+            files[name] = open(column_path, 'wb')
+            _write_npy_header(files[name], dtype[name], count)
+        for rows in chunks:
+            written += len(rows)
+            if written > count:
+                raise ValueError("Число строк изменилось во время выгрузки")
+            array = np.array(rows, dtype=dtype)
+            for name, file in files.items():
+                file.write(np.ascontiguousarray(array[name]).tobytes())
+        for file in files.values():
+            file.close()
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, column_path in paths.items():
+                archive.write(column_path, f'{name}.npy')
+    finally:
+        for file in files.values():
+            file.close()
+        for column_path in paths.values():
+            if os.path.exists(column_path):
+                os.remove(column_path)
+        os.rmdir(directory)
+    return written
+
+
+def export_table(db, kind, path, file_format=None, start_date=None, end_date=None, chunk_size=CHUNK_SIZE):
+    # Выгружает журнал (log), справочник блюд (dishes) или суммы по дням
+    # (daily) в CSV, JSONL, .npy или .npz; возвращает число строк. Строки
+    # читаются из курсора порциями по chunk_size и сразу пишутся в файл.
+    if kind not in EXPORTS:
+        raise ValueError(f"Неизвестная выгрузка: {kind}")
+    file_format = file_format or detect_format(path)
+    if file_format not in FORMATS:
+        raise ValueError(f"Неизвестный формат файла: {file_format}")
+    columns, build_query = EXPORTS[kind]
+    with db._reading() as connection:
+        # Архивы подключаются вне транзакции
+        query, params = build_query(connection, db.config, start_date or FIRST_DATE, end_date or LAST_DATE)
+        # Все запросы выгрузки читают один снимок базы: число строк в
+        # заголовке .npy совпадает с выгруженным
+        connection.execute('BEGIN')
+        try:
+            if file_format in ('npy', 'npz'):
+                dtype = _npy_dtype(connection, columns, query, params)
+                count = connection.execute(f'SELECT COUNT(*) FROM ({query})', params).fetchone()[0]
+                chunks = _chunks(connection.execute(query, params), chunk_size)
+                write = _write_npy if file_format == 'npy' else _write_npz
+                written = write(path, dtype, count, chunks)
+                if written != count:
+                    raise ValueError("Число строк изменилось во время выгрузки")
+                return written
+            chunks = _chunks(connection.execute(query, params), chunk_size)
+            write = _write_csv if file_format == 'csv' else _write_jsonl
+            return write(path, columns, chunks)
+        finally:
+            connection.rollback()
@@ -0,0 +1,301 @@
+import csv
+import json
+import os
+from datetime import date as date_type
+from itertools import islice
+from operator import itemgetter
+
+from db import DAILY_TOTALS_SELECT, Database
+
+DISH_FIELDS = ('name', 'kcal', 'proteins', 'fats', 'carbs')
+LOG_FIELDS = ('date', 'dish', 'grams')
+
+BATCH_SIZE = 50000
+# Размер кэша страниц SQLite на время загрузки (в КиБ, как в PRAGMA cache_size)
+IMPORT_CACHE_KIB = 262144
+# Сколько отклоненных строк хранить в отчете (в файл отклоненных пишутся все)
+MAX_REPORTED_REJECTS = 1000
+# Индексы журнала, которые пересоздаются при загрузке большого файла
+CALORIE_LOG_INDEXES = (
+    ('idx_calorie_log_date', 'date, calories, proteins, fats, carbs'),
+    ('idx_calorie_log_dish', 'dish_id, date'),
+)
+
+
+class ImportReport:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.rejects = []
+
+    def reject(self, line_number, reason, row, rejects_writer=None):
+        self.rejected += 1
+        if len(self.rejects) < MAX_REPORTED_REJECTS:
+            self.rejects.append((line_number, reason, row))
+        if rejects_writer is not None:
+            rejects_writer.writerow([line_number, reason, json.dumps(row, ensure_ascii=False)])
+
+    def summary(self):
+        return f"Загружено строк: {self.accepted}, отклонено: {self.rejected}"
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    raise ValueError(f"Неизвестный формат файла: {path}")
+
+
+def read_rows(file, file_format, fields):
+    # Построчно возвращает (номер строки, кортеж значений полей fields);
+    # вместо кортежа - исходная строка, если ее не удалось разобрать
+    if file_format == 'csv':
+        reader = csv.reader(file)
+        header = [column.strip() for column in next(reader, [])]
+        missing = [field for field in fields if field not in header]
+        if missing:
+            raise ValueError(f"В файле нет столбцов: {', '.join(missing)}")
+        getter = itemgetter(*[header.index(field) for field in fields])
+        for row in reader:
+            if not row:
+                continue
+            try:
+                yield reader.line_num, getter(row)
+            except IndexError:
+                yield reader.line_num, ','.join(row)
+    elif file_format == 'jsonl':
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+                yield line_number, tuple(row.get(field) for field in fields)
+            except (json.JSONDecodeError, AttributeError):
+                yield line_number, line.rstrip('\n')
+    else:
+        raise ValueError(f"Неизвестный формат файла: {file_format}")
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _parse_amount(value, field):
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректное значение {field}")
+    if not 0 <= amount < float('inf'):
+        raise ValueError(f"некорректное значение {field}")
+    return amount
+
+
+def _open_rejects(rejects_path):
+    if rejects_path is None:
+        return None, None
+    file = open(rejects_path, 'w', newline='', encoding='utf-8')
+    writer = csv.writer(file)
+    writer.writerow(['line', 'reason', 'row'])
+    return file, writer
+
+
+def _close_rejects(file, report):
+    if file is None:
+        return
+    file.close()
+    # Файл только с заголовком не нужен
+    if not report.rejected:
+        os.remove(file.name)
+
+
+def _estimate_rows(path, sample_size=65536):
+    with open(path, 'rb') as file:
+        sample = file.read(sample_size)
+    lines = max(sample.count(b'\n'), 1)
+    return int(os.path.getsize(path) * lines / max(len(sample), 1))
+
+
+def import_dishes(db, path, file_format=None, batch_size=BATCH_SIZE, rejects_path=None):
+    # Загружает справочник блюд; блюда с существующим названием обновляются,
+    # рецепты с ними в составе пересчитываются, как в Database.update_dish.
+    # История приемов пищи при этом не меняется (см. Database.recalculate_history).
+    report = ImportReport()
+    connection = db.connection
+    # Блюда, входящие в рецепты: если их КБЖУ изменятся, рецепты пересчитываются
+    components = dict(connection.execute('''
+        SELECT name, id FROM dishes WHERE id IN (SELECT dish_id FROM recipe_items)
+    '''))
+    rejects_file, rejects_writer = _open_rejects(rejects_path)
+    try:
+        with open(path, newline='', encoding='utf-8') as file:
+            rows = read_rows(file, file_format or detect_format(path), DISH_FIELDS)
+            for batch in _batches(rows, batch_size):
+                values = []
+                for line_number, row in batch:
+                    try:
+                        if isinstance(row, str):
+                            raise ValueError("строку не удалось разобрать")
+                        name = str(row[0] or '').strip()
+                        if not name:
+                            raise ValueError("пустое название блюда")
+                        values.append((name, _parse_amount(row[1], 'kcal'), _parse_amount(row[2], 'proteins'),
+                                       _parse_amount(row[3], 'fats'), _parse_amount(row[4], 'carbs')))
+                    except (TypeError, ValueError) as e:
+                        report.reject(line_number, str(e), row, rejects_writer)
+                with connection:
+                    # КБЖУ составляющих рецептов до загрузки порции
+                    before = {name: connection.execute('SELECT kcal, proteins, fats, carbs FROM dishes WHERE id = ?',
+                                                       (components[name],)).fetchone()
+                              for name, *_ in values if name in components}
+                    connection.executemany('''
+                        INSERT INTO dishes (name, kcal, proteins, fats, carbs) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(name) DO UPDATE SET
+                            kcal = excluded.kcal,
+                            proteins = excluded.proteins,
+                            fats = excluded.fats,
+                            carbs = excluded.carbs
+                    ''', values)
+                    after = {name: tuple(nutrients) for name, *nutrients in values if name in before}
+                    changed = [components[name] for name in before if before[name] != after[name]]
+                    if changed:
+                        db._recompute_recipes(db._recipes_containing(changed))
+                report.accepted += len(values)
+    finally:
+        _close_rejects(rejects_file, report)
+        db._notify_dishes_changed('reset')
+    return report
+
+
+def import_calorie_log(db, path, file_format=None, batch_size=BATCH_SIZE, rejects_path=None,
+                       rebuild_indexes=None):
+    # Загружает историю приемов пищи: date, dish (название блюда), grams.
+    # Весь файл загружается одной транзакцией. Если файл велик по сравнению с
+    # журналом (или rebuild_indexes=True), индексы журнала удаляются на время
+    # загрузки и строятся заново в конце: это быстрее, чем вставлять в них
+    # строки по одной.
+    report = ImportReport()
+    connection = db.connection
+    # Для каждого блюда - id и КБЖУ на грамм
+    dishes = {
+        row[1]: (row[0], row[2] / 100, row[3] / 100, row[4] / 100, row[5] / 100)
+        for row in connection.execute('SELECT id, name, kcal, proteins, fats, carbs FROM dishes')
+    }
+    last_id = connection.execute('SELECT MAX(id) FROM calorie_log').fetchone()[0] or 0
+    if rebuild_indexes is None:
+        rebuild_indexes = _estimate_rows(path) > max(last_id // 4, batch_size)
+    # Даты повторяются во многих строках, поэтому каждая проверяется один раз
+    valid_dates = set()
+
+    rejects_file, rejects_writer = _open_rejects(rejects_path)
+    cache_size = connection.execute('PRAGMA cache_size').fetchone()[0]
+    connection.execute(f'PRAGMA cache_size = {-IMPORT_CACHE_KIB}')
+    try:
+        with connection:
+            # Явный BEGIN, чтобы удаление индекса вошло в ту же транзакцию
+            connection.execute('BEGIN')
+            if rebuild_indexes:
+                for name, _ in CALORIE_LOG_INDEXES:
+                    connection.execute(f'DROP INDEX IF EXISTS {name}')
+            with open(path, newline='', encoding='utf-8') as file:
+                rows = read_rows(file, file_format or detect_format(path), LOG_FIELDS)
+                for batch in _batches(rows, batch_size):
+                    entries = []
+                    for line_number, row in batch:
+                        try:
+                            if isinstance(row, str):
+                                raise ValueError("строку не удалось разобрать")
+                            date, dish_name, grams = row
+                            if date not in valid_dates:
+                                # С Python 3.11 fromisoformat принимает и другие записи
+                                # ISO 8601 (например, неделю 2024-W09-5), а запросы по
+                                # периодам сравнивают даты как строки ГГГГ-ММ-ДД
+                                try:
+                                    valid = isinstance(date, str) and date_type.fromisoformat(date).isoformat() == date
+                                except ValueError:
+                                    valid = False
+                                if not valid:
+                                    raise ValueError("дата должна быть в формате ГГГГ-ММ-ДД")
+                                valid_dates.add(date)
+                            dish = dishes.get(dish_name)
+                            if dish is None:
+                                dish = dishes.get(str(dish_name or '').strip())
+                                if dish is None:
+                                    raise ValueError("блюдо не найдено")
+                            try:
+                                grams = float(grams)
+                            except (TypeError, ValueError):
+                                raise ValueError("некорректное количество граммов")
+                            if not 0 < grams < float('inf'):
+                                raise ValueError("некорректное количество граммов")
+                        except (TypeError, ValueError) as e:
+                            report.reject(line_number, str(e), row, rejects_writer)
+                            continue
+                        entries.append((date, dish[0], grams, grams * dish[1], grams * dish[2],
+                                        grams * dish[3], grams * dish[4]))
+
+                    # Вставка по порядку дат дописывает индекс по дате в конец
+                    entries.sort()
+                    connection.executemany('''
+                        INSERT INTO calorie_log (date, dish_id, grams, calories, proteins, fats, carbs)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', entries)
+                    report.accepted += len(entries)
+
+            db._forget_monthly_stats([row[0] for row in connection.execute(
+                'SELECT DISTINCT date FROM calorie_log WHERE id > ?', (last_id,))])
+            # Суммы по дням для всех загруженных строк - одним проходом по новым id
+            connection.execute(f'''
+                INSERT INTO daily_totals (date, kcal, proteins, fats, carbs)
+                {DAILY_TOTALS_SELECT}
+                WHERE cl.id > ?
+                GROUP BY cl.date
+                ON CONFLICT(date) DO UPDATE SET
+                    kcal = kcal + excluded.kcal,
+                    proteins = proteins + excluded.proteins,
+                    fats = fats + excluded.fats,
+                    carbs = carbs + excluded.carbs
+            ''', (last_id,))
+            if rebuild_indexes:
+                for name, columns in CALORIE_LOG_INDEXES:
+                    connection.execute(f'CREATE INDEX IF NOT EXISTS {name} ON calorie_log({columns})')
+    finally:
+        connection.execute(f'PRAGMA cache_size = {cache_size}')
+        _close_rejects(rejects_file, report)
+        # Загруженные записи могут относиться к любым дням
+        db._log_changed()
+    return report
+
+
+IMPORTERS = {
+    'dishes': import_dishes,
+    'log': import_calorie_log,
+}
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Пакетная загрузка блюд и истории приемов пищи")
+    parser.add_argument('kind', choices=sorted(IMPORTERS),
+                        help="dishes: name,kcal,proteins,fats,carbs; log: date,dish,grams")
+    parser.add_argument('path', help="файл CSV (с заголовком) или JSONL")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="формат файла, по умолчанию по расширению")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--rejects', help="куда записать отклоненные строки (CSV)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = IMPORTERS[args.kind](Database(), args.path, args.format, args.batch_size, args.rejects)
+    elapsed = time.perf_counter() - started
+    print(report.summary())
+    print(f"Время: {elapsed:.2f} с ({(report.accepted + report.rejected) / max(elapsed, 1e-9):.0f} строк/с)")
+    for line_number, reason, row in report.rejects[:20]:
+        print(f"  строка {line_number}: {reason}")
@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+# Методы Database, время которых замеряется
+INSTRUMENTED_METHODS = (
+    'add_dish', 'get_dishes', 'search_dishes', 'get_dish', 'update_dish', 'track_calories', 'track_meal',
+    'save_recipe', 'get_recipe_items', 'get_data_by_date', 'delete_dish', 'get_calorie_data_by_date_range',
+    'recalculate_history', 'rebuild_daily_totals', 'verify_daily_totals', 'suggest_dishes',
+)
+
+# Верхние границы столбцов гистограммы времени вызова, мс
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+# Запросы, для которых имеет смысл EXPLAIN QUERY PLAN
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+SLOW_QUERY_LOG_BYTES = 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+RECENT_SLOW_QUERIES = 100
+
+sql_logger = logging.getLogger('calories.sql')
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.statements = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * len(HISTOGRAM_BOUNDS_MS)
+
+    def add(self, elapsed_ms, rows, statements, failed):
+        self.calls += 1
+        self.errors += failed
+        self.rows += rows
+        self.statements += statements
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for index, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if elapsed_ms <= bound:
+                self.histogram[index] += 1
+                break
+
+    def mean_ms(self):
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    def percentile_ms(self, fraction):
+        # Оценка по гистограмме: верхняя граница столбца, где набралась доля fraction
+        needed = fraction * self.calls
+        seen = 0
+        for bound, count in zip(HISTOGRAM_BOUNDS_MS, self.histogram):
+            seen += count
+            if count and seen >= needed:
+                return min(bound, self.max_ms)
+        return 0.0
+
+    def copy(self):
+        stats = MethodStats()
+        stats.__dict__.update(self.__dict__, histogram=list(self.histogram))
+        return stats
+
+
+class SlowQuery:
+    def __init__(self, method, sql, elapsed_ms, plan):
+        self.moment = time.time()
+        self.method = method
+        # Запросы в коде многострочные, в журнале - одной строкой
+        self.sql = ' '.join(sql.split())
+        self.elapsed_ms = elapsed_ms
+        self.plan = plan
+
+
+class Instrumentation:
+    # Необязательные замеры для Database: время и число строк по методам,
+    # трассировка SQL и журнал медленных запросов с планом выполнения.
+    # Один объект можно подключить к нескольким соединениям (например, к
+    # соединению интерфейса и фонового потока), счетчики у них общие.
+
+    def __init__(self, slow_query_ms=50, slow_query_log=None, trace_sql=False):
+        self.slow_query_ms = slow_query_ms
+        self.trace_sql = trace_sql
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._slow_queries = deque(maxlen=RECENT_SLOW_QUERIES)
+        self._slow_log = None
+        if slow_query_log:
+            self._slow_log = logging.getLogger(f'calories.slow_queries.{id(self)}')
+            self._slow_log.propagate = False
+            self._slow_log.setLevel(logging.INFO)
+            handler = RotatingFileHandler(slow_query_log, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                          backupCount=SLOW_QUERY_LOG_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self._slow_log.addHandler(handler)
+
+    def attach(self, db):
+        # Подменяет методы экземпляра db обертками с замером и включает
+        # трассировку его соединений. Без attach Database работает как раньше.
+        tracer = _DatabaseTracer(self, db)
+        tracer.trace(db.connection)
+        if db.readers is not None:
+            db.readers.on_connect.append(tracer.trace)
+        for name in INSTRUMENTED_METHODS:
+            setattr(db, name, tracer.wrap(name, getattr(db, name)))
+
+    def snapshot(self):
+        # Копии счетчиков: {метод: MethodStats} и последние медленные запросы
+        with self._lock:
+            methods = {name: stats.copy() for name, stats in self._methods.items()}
+            slow_queries = list(self._slow_queries)
+        return methods, slow_queries
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._slow_queries.clear()
+
+    def _record(self, method, elapsed_ms, rows, statements, failed):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = MethodStats()
+            stats.add(elapsed_ms, rows, statements, failed)
+
+    def _record_slow(self, slow_query):
+        with self._lock:
+            self._slow_queries.append(slow_query)
+        if self._slow_log is not None:
+            plan = ''.join(f'\n    {line}' for line in slow_query.plan)
+            self._slow_log.info(f"{slow_query.elapsed_ms:.1f} мс {slow_query.method}: {slow_query.sql}{plan}")
+
+
+class _DatabaseTracer:
+    # Трассировка соединений одного экземпляра Database: соединения записи и
+    # соединений из пула читателей. Методы могут вызываться из разных потоков,
+    # поэтому текущий вызов и его запросы хранятся отдельно для каждого потока.
+
+    def __init__(self, instrumentation, db):
+        self.instrumentation = instrumentation
+        self.db = db
+        self.owner = threading.get_ident()
+        self.local = threading.local()
+
+    def trace(self, connection):
+        connection.set_trace_callback(self.on_statement)
+
+    def on_statement(self, sql):
+        local = self.local
+        if getattr(local, 'explaining', False):
+            return
+        if getattr(local, 'depth', 0):
+            local.statements.append((time.perf_counter(), sql))
+        if self.instrumentation.trace_sql:
+            sql_logger.debug(sql)
+
+    def _total_changes(self):
+        # Соединение записи доступно только из потока, который его открыл
+        if threading.get_ident() != self.owner:
+            return None
+        return self.db.connection.total_changes
+
+    def wrap(self, name, method):
+        local = self.local
+
+        def instrumented(*args, **kwargs):
+            if getattr(local, 'depth', 0):
+                return method(*args, **kwargs)
+            local.depth = 1
+            local.statements = []
+            changes = self._total_changes()
+            started = time.perf_counter()
+            failed = False
+            result = None
+            try:
+                result = method(*args, **kwargs)
+                return result
+            except Exception:
+                failed = True
+                raise
+            finally:
+                finished = time.perf_counter()
+                local.depth = 0
+                statements, local.statements = local.statements, []
+                changed = self._total_changes() - changes if changes is not None else 0
+                rows = changed or _count_rows(result)
+                self.instrumentation._record(name, (finished - started) * 1000, rows, len(statements), failed)
+                self._check_slow(name, statements, finished)
+        instrumented.__name__ = name
+        return instrumented
+
+    def _check_slow(self, method, statements, finished):
+        # Время запроса - до начала следующего запроса или до конца вызова,
+        # то есть вместе с обработкой его результата в Python
+        threshold = self.instrumentation.slow_query_ms
+        ends = [moment for moment, _ in statements[1:]] + [finished]
+        slow = [(sql, (end - moment) * 1000) for (moment, sql), end in zip(statements, ends)
+                if (end - moment) * 1000 >= threshold]
+        for sql, elapsed_ms in slow:
+            self.instrumentation._record_slow(SlowQuery(method, sql, elapsed_ms, self._explain(sql)))
+
+    def _explain(self, sql):
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        # EXPLAIN ничего не меняет, поэтому подходит и соединение для чтения
+        self.local.explaining = True
+        try:
+            with self.db._reading() as connection:
+                rows = connection.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+        except Exception as e:
+            return [f"план недоступен: {e}"]
+        finally:
+            self.local.explaining = False
+        # Строки плана: (id, parent, notused, detail); отступ по вложенности
+        depths = {0: -1}
+        plan = []
+        for node_id, parent, _, detail in rows:
+            depths[node_id] = depths.get(parent, -1) + 1
+            plan.append('  ' * depths[node_id] + detail)
+        return plan
+
+
+def _count_rows(result):
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    return 1
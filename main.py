@@ -1,10 +1,77 @@
+import argparse
+import logging
 import sys
-from PyQt5.QtWidgets import QApplication
+
+import startup
+
+parser = argparse.ArgumentParser(description="Калькулятор калорий")
+parser.add_argument('--db', help="файл базы данных (по умолчанию calories.db или переменная CALORIES_DB)")
+# Режим замера запуска: печатает время каждого этапа и закрывает приложение
+# после первой отрисовки
+parser.add_argument('--startup-profile', action='store_true', help="замерить время запуска")
+parser.add_argument('--diagnostics', action='store_true',
+                    help="замерять запросы к базе и показать окно диагностики")
+parser.add_argument('--slow-query-ms', type=float, default=50,
+                    help="с какого времени запрос считается медленным (с --diagnostics)")
+parser.add_argument('--slow-query-log', help="файл журнала медленных запросов (с --diagnostics)")
+parser.add_argument('--trace-sql', action='store_true', help="печатать все SQL-запросы (с --diagnostics)")
+parser.add_argument('--service', nargs='?', const='auto', metavar='ADDRESS',
+                    help="писать через сервис базы (service.py): путь к сокету или хост:порт, "
+                         "по умолчанию <база>.sock")
+# Остальные аргументы передаются Qt
+args, qt_args = parser.parse_known_args()
+sys.argv = sys.argv[:1] + qt_args
+if args.startup_profile:
+    startup.enable()
+if args.db:
+    from storage import StorageConfig, set_default_config
+
+    set_default_config(StorageConfig.from_env(path=args.db))
+
+from PyQt5.QtWidgets import QApplication, QMessageBox
+from PyQt5.QtCore import QTimer
+startup.mark("импорт PyQt5")
 from app import CalorieApp
+startup.mark("импорт модулей приложения")
+
+
+def finish_startup_profile():
+    startup.mark("первая отрисовка окна")
+    startup.report()
+    QApplication.instance().quit()
+
+
+def service_address():
+    if args.service != 'auto':
+        return args.service
+    from service import default_address
+    from storage import default_config
+
+    return default_address(default_config().path)
+
+
+def create_instrumentation():
+    if not args.diagnostics:
+        return None
+    from instrumentation import Instrumentation
+
+    if args.trace_sql:
+        logging.basicConfig(format='%(name)s: %(message)s')
+        logging.getLogger('calories.sql').setLevel(logging.DEBUG)
+    return Instrumentation(args.slow_query_ms, args.slow_query_log, args.trace_sql)
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    window = CalorieApp()
+    startup.mark("создание QApplication")
+    try:
+        window = CalorieApp(warm_up_plotting=not startup.is_enabled(), instrumentation=create_instrumentation(),
+                            service_address=service_address() if args.service else None)
+    except ValueError as e:
+        # Сервис базы недоступен или работает с другим файлом
+        QMessageBox.critical(None, "Ошибка", str(e))
+        sys.exit(1)
     window.show()
+    if startup.is_enabled():
+        QTimer.singleShot(0, finish_startup_profile)
     sys.exit(app.exec_())
@@ -0,0 +1,143 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QListView, QListWidget,
+                             QLabel, QDateEdit, QMessageBox, QInputDialog)
+
+from dish_list_model import DishListModel
+
+
+class MealDialog(QDialog):
+    # Прием пищи из нескольких блюд: состав собирается в списке и
+    # записывается одной транзакцией или сохраняется как рецепт
+    def __init__(self, date, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Прием пищи из нескольких блюд")
+        self.resize(500, 700)
+
+        self.db = self.parent().db
+        # Состав: (название блюда, граммы, ккал на 100 г)
+        self.items = []
+
+        layout = QVBoxLayout()
+
+        self.search_line = QLineEdit(self)
+        self.search_line.setPlaceholderText("Поиск блюда...")
+        self.search_line.textChanged.connect(self.update_dish_list)
+        layout.addWidget(self.search_line)
+
+        self.dish_model = DishListModel(self.db, self)
+        self.dish_list = QListView(self)
+        self.dish_list.setUniformItemSizes(True)
+        self.dish_list.setModel(self.dish_model)
+        layout.addWidget(self.dish_list)
+
+        add_layout = QHBoxLayout()
+        self.grams_input = QLineEdit(self)
+        self.grams_input.setPlaceholderText("Введите количество граммов")
+        self.grams_input.returnPressed.connect(self.add_item)
+        add_layout.addWidget(self.grams_input)
+        add_button = QPushButton("Добавить в прием пищи", self)
+        add_button.clicked.connect(self.add_item)
+        add_layout.addWidget(add_button)
+        layout.addLayout(add_layout)
+
+        layout.addWidget(QLabel("Состав приема пищи:"))
+        self.items_list = QListWidget(self)
+        layout.addWidget(self.items_list)
+
+        remove_button = QPushButton("Убрать из состава", self)
+        remove_button.clicked.connect(self.remove_item)
+        layout.addWidget(remove_button)
+
+        self.total_label = QLabel(self)
+        layout.addWidget(self.total_label)
+
+        self.date_input = QDateEdit(self)
+        self.date_input.setDate(date)
+        layout.addWidget(QLabel("Дата приема пищи:"))
+        layout.addWidget(self.date_input)
+
+        buttons_layout = QHBoxLayout()
+        track_button = QPushButton("Записать прием пищи", self)
+        track_button.clicked.connect(self.track_meal)
+        buttons_layout.addWidget(track_button)
+        recipe_button = QPushButton("Сохранить как рецепт", self)
+        recipe_button.clicked.connect(self.save_recipe)
+        buttons_layout.addWidget(recipe_button)
+        layout.addLayout(buttons_layout)
+
+        self.setLayout(layout)
+        self.update_total()
+
+    def update_dish_list(self):
+        search_text = self.search_line.text()
+        db_worker = self.parent().db_worker
+        if not search_text.strip():
+            db_worker.cancel('meal_dialog_search')
+            self.dish_model.setMatches(None)
+            return
+        db_worker.submit('meal_dialog_search', 'search_dishes', search_text, callback=self.dish_model.setMatches)
+
+    def add_item(self):
+        dish_name = self.dish_model.name_at(self.dish_list.currentIndex())
+        if not dish_name:
+            QMessageBox.warning(self, "Ошибка", "Пожалуйста, выберите блюдо из списка.")
+            return
+        try:
+            grams = float(self.grams_input.text())
+            if grams <= 0:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, "Ошибка", "Введите корректное количество граммов.")
+            return
+
+        dish = self.db.get_dish(dish_name)
+        if dish is None:
+            QMessageBox.warning(self, "Ошибка", "Не удалось получить данные блюда")
+            return
+        self.items.append((dish_name, grams, dish[0]))
+        self.items_list.addItem(f"{dish_name} — {grams:g} г ({grams * dish[0] / 100:.2f} ккал)")
+        self.grams_input.clear()
+        self.update_total()
+
+    def remove_item(self):
+        row = self.items_list.currentRow()
+        if row < 0:
+            return
+        self.items_list.takeItem(row)
+        del self.items[row]
+        self.update_total()
+
+    def update_total(self):
+        grams = sum(item[1] for item in self.items)
+        kcal = sum(item[1] * item[2] / 100 for item in self.items)
+        self.total_label.setText(f"Итого: {grams:g} г, {kcal:.2f} ккал")
+
+    def meal_items(self):
+        return [(dish_name, grams) for dish_name, grams, _ in self.items]
+
+    def track_meal(self):
+        date = self.date_input.date().toString("yyyy-MM-dd")
+        try:
+            total_calories = self.db.track_meal(self.meal_items(), date)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
+        QMessageBox.information(self, "Результат",
+                                f"{total_calories:.2f} ккал добавлено из {len(self.items)} блюд.")
+        self.accept()
+
+    def save_recipe(self):
+        if not self.items:
+            QMessageBox.warning(self, "Ошибка", "Не выбрано ни одного блюда")
+            return
+        name, ok = QInputDialog.getText(self, "Сохранить как рецепт", "Название рецепта:")
+        if not ok:
+            return
+        try:
+            kcal, proteins, fats, carbs = self.db.save_recipe(name, self.meal_items())
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
+        QMessageBox.information(self, "Успех",
+                                f"Рецепт {name.strip()} сохранен: на 100 г {kcal:.2f} ккал, "
+                                f"Б {proteins:.2f} г, Ж {fats:.2f} г, У {carbs:.2f} г. "
+                                f"Его можно выбрать в списке блюд как обычное блюдо.")
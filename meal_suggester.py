@@ -0,0 +1,176 @@
+import numpy as np
+
+# Дневная норма КБЖУ по умолчанию: ккал, белки, жиры, углеводы
+DEFAULT_TARGETS = (2000, 100, 70, 250)
+MIN_GRAMS = 10
+MAX_GRAMS = 500
+GRAMS_STEP = 5
+SUGGESTIONS = 10
+# Сколько блюд с лучшей оценкой по отдельности перебирается парами; к ним
+# добавляются блюда с наибольшей долей каждого из КБЖУ, которые дополняют
+# друг друга, даже если по одному подходят плохо
+PAIR_CANDIDATES = 300
+PAIR_CANDIDATES_PER_MACRO = 50
+# Начальный размер массивов; при заполнении они растут вдвое
+INITIAL_CAPACITY = 1024
+
+
+def _round_grams(grams):
+    return np.clip(np.round(grams / GRAMS_STEP) * GRAMS_STEP, MIN_GRAMS, MAX_GRAMS)
+
+
+def _best(errors, limit):
+    # Индексы limit наименьших конечных ошибок по возрастанию
+    finite = np.flatnonzero(np.isfinite(errors))
+    if len(finite) > limit:
+        finite = finite[np.argpartition(errors[finite], limit)[:limit]]
+    return finite[np.argsort(errors[finite], kind='stable')]
+
+
+class MealSuggester:
+    # КБЖУ блюд на грамм в матрице NumPy (строка - блюдо) для подбора блюд
+    # под оставшуюся дневную норму. Матрица загружается при первом подборе и
+    # обновляется по уведомлениям Database об изменении таблицы dishes: новые
+    # и измененные блюда дописываются в конец, удаленные помечаются мертвыми
+    # до следующей полной загрузки.
+    #
+    # Ошибка подбора - сумма квадратов отклонений от оставшейся нормы, каждое
+    # КБЖУ в долях дневной нормы. Для одного блюда граммы, дающие наименьшую
+    # ошибку, считаются сразу для всех блюд; для пар решается система 2x2 по
+    # матрице скалярных произведений блюд-кандидатов.
+
+    def __init__(self, db):
+        self.db = db
+        self._loaded = False
+        db.add_dishes_listener(self._on_dishes_changed)
+
+    def _load(self):
+        rows = self.db.connection.execute('SELECT id, name, kcal, proteins, fats, carbs FROM dishes').fetchall()
+        capacity = max(INITIAL_CAPACITY, len(rows))
+        self._names = [row[1] for row in rows]
+        self._slots = {row[0]: slot for slot, row in enumerate(rows)}
+        self._per_gram = np.zeros((capacity, 4))
+        self._alive = np.zeros(capacity, dtype=bool)
+        if rows:
+            self._per_gram[:len(rows)] = np.fromiter((row[2:] for row in rows), dtype=(float, 4), count=len(rows)) / 100
+            self._alive[:len(rows)] = True
+        self._compact = None
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load()
+
+    def _append(self, dish_id, name, macros):
+        slot = len(self._names)
+        if slot == len(self._alive):
+            self._per_gram = np.concatenate([self._per_gram, np.zeros_like(self._per_gram)])
+            self._alive = np.concatenate([self._alive, np.zeros_like(self._alive)])
+        self._names.append(name)
+        self._slots[dish_id] = slot
+        self._per_gram[slot] = np.asarray(macros, dtype=float) / 100
+        self._alive[slot] = True
+        self._compact = None
+
+    def _remove(self, dish_id):
+        slot = self._slots.pop(dish_id, None)
+        if slot is not None:
+            self._alive[slot] = False
+            self._names[slot] = None
+            self._compact = None
+
+    def _on_dishes_changed(self, action, dish_id=None, name=None):
+        if not self._loaded:
+            return
+        if action == 'reset':
+            self._loaded = False
+            return
+        if action in ('updated', 'deleted'):
+            self._remove(dish_id)
+        if action in ('added', 'updated'):
+            macros = self.db.get_dish(name)
+            if macros is None:
+                self._loaded = False
+                return
+            self._append(dish_id, name, macros)
+        # Слишком много мертвых строк - перечитываем матрицу при следующем подборе
+        if len(self._names) > 2 * len(self._slots) + INITIAL_CAPACITY:
+            self._loaded = False
+
+    def _alive_rows(self):
+        # (слоты живых блюд, их КБЖУ на грамм) без мертвых строк; копия
+        # делается один раз после изменения каталога, а не при каждом подборе
+        if self._compact is None:
+            slots = np.flatnonzero(self._alive[:len(self._names)])
+            self._compact = slots, self._per_gram[slots]
+        return self._compact
+
+    def invalidate(self):
+        self._loaded = False
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._slots)
+
+    def suggest(self, remaining, targets, limit=SUGGESTIONS):
+        # Возвращает (блюда по одному, пары блюд); каждый вариант -
+        # ([(название, граммы), ...], КБЖУ варианта, ошибка)
+        self._ensure_loaded()
+        targets = np.asarray(targets, dtype=float)
+        if targets.shape != (4,) or (targets <= 0).any():
+            raise ValueError("Дневная норма КБЖУ должна быть больше нуля")
+        goal = np.clip(np.asarray(remaining, dtype=float), 0, None) / targets
+        if not goal.any():
+            raise ValueError("Дневная норма уже набрана")
+
+        slots, per_gram = self._alive_rows()
+        scaled = per_gram / targets
+        norms = np.einsum('ij,ij->i', scaled, scaled)
+        projections = scaled @ goal
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grams = _round_grams(projections / norms)
+        # |grams * scaled - goal|^2 без промежуточной матрицы отклонений
+        errors = grams * grams * norms - 2 * grams * projections + goal @ goal
+        errors[norms == 0] = np.inf
+
+        singles = [([(self._names[slots[i]], float(grams[i]))], tuple(per_gram[i] * grams[i]), errors[i])
+                   for i in _best(errors, limit)]
+        return singles, self._suggest_pairs(slots, per_gram, scaled, goal, errors, limit)
+
+    def _suggest_pairs(self, slots, per_gram, scaled, goal, single_errors, limit):
+        candidates = [_best(single_errors, PAIR_CANDIDATES)]
+        totals = scaled.sum(axis=1)
+        for macro in range(scaled.shape[1]):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                shares = scaled[:, macro] / totals
+            candidates.append(_best(-np.nan_to_num(shares, nan=-np.inf), PAIR_CANDIDATES_PER_MACRO))
+        candidates = np.unique(np.concatenate(candidates))
+        if len(candidates) < 2:
+            return []
+
+        vectors = scaled[candidates]
+        products = vectors @ vectors.T
+        projections = vectors @ goal
+        first, second = np.triu_indices(len(candidates), 1)
+        g11, g22, g12 = products[first, first], products[second, second], products[first, second]
+        p1, p2 = projections[first], projections[second]
+        determinant = g11 * g22 - g12 * g12
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grams1 = (p1 * g22 - p2 * g12) / determinant
+            grams2 = (p2 * g11 - p1 * g12) / determinant
+        # Пара имеет смысл, только если оба блюда входят в нее с положительным весом
+        valid = (determinant > 1e-12 * g11 * g22) & (grams1 > 0) & (grams2 > 0)
+        grams1, grams2 = _round_grams(np.nan_to_num(grams1)), _round_grams(np.nan_to_num(grams2))
+        errors = (goal @ goal - 2 * (grams1 * p1 + grams2 * p2)
+                  + grams1 * grams1 * g11 + 2 * grams1 * grams2 * g12 + grams2 * grams2 * g22)
+        # Пара должна быть лучше каждого из своих блюд по отдельности
+        best_single = np.minimum(single_errors[candidates[first]], single_errors[candidates[second]])
+        errors[~valid | (errors >= best_single)] = np.inf
+
+        pairs = []
+        for index in _best(errors, limit):
+            i, j = candidates[first[index]], candidates[second[index]]
+            items = [(self._names[slots[i]], float(grams1[index])), (self._names[slots[j]], float(grams2[index]))]
+            macros = per_gram[i] * grams1[index] + per_gram[j] * grams2[index]
+            pairs.append((items, tuple(macros), errors[index]))
+        return pairs
@@ -0,0 +1,287 @@
+import sqlite3
+
+
+# Каждая миграция - (номер версии, функция). Функции выполняются по порядку
+# внутри одной транзакции, номер версии записывается в таблицу schema_version.
+
+
+def _initial_schema(connection):
+    # Исходная схема приложения: calorie_log ссылается на блюдо по названию
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS dishes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            kcal REAL NOT NULL,
+            proteins REAL NOT NULL,
+            fats REAL NOT NULL,
+            carbs REAL NOT NULL
+        )
+    ''')
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS calorie_log (
+            id INTEGER PRIMARY KEY,
+            dish_name TEXT NOT NULL,
+            grams INTEGER NOT NULL,
+            calories REAL NOT NULL,
+            date TEXT NOT NULL,
+            FOREIGN KEY(dish_name) REFERENCES dishes(name)
+        )
+    ''')
+
+
+def _dish_id_foreign_key(connection):
+    # Уникальные названия блюд: при дублях остается блюдо с наименьшим id
+    connection.execute('''
+        CREATE TABLE dishes_v2 (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            kcal REAL NOT NULL,
+            proteins REAL NOT NULL,
+            fats REAL NOT NULL,
+            carbs REAL NOT NULL
+        )
+    ''')
+    connection.execute('''
+        INSERT INTO dishes_v2 (id, name, kcal, proteins, fats, carbs)
+        SELECT id, name, kcal, proteins, fats, carbs FROM dishes
+        WHERE id IN (SELECT MIN(id) FROM dishes GROUP BY name)
+    ''')
+
+    # Записи журнала, которые не ссылаются ни на одно блюдо (например, после
+    # переименования блюда), не учитывались в КБЖУ. Сохраняем их отдельно.
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS calorie_log_orphans (
+            id INTEGER PRIMARY KEY,
+            dish_name TEXT NOT NULL,
+            grams REAL NOT NULL,
+            calories REAL NOT NULL,
+            date TEXT NOT NULL
+        )
+    ''')
+    connection.execute('''
+        INSERT INTO calorie_log_orphans (id, dish_name, grams, calories, date)
+        SELECT id, dish_name, grams, calories, date FROM calorie_log
+        WHERE dish_name NOT IN (SELECT name FROM dishes_v2)
+    ''')
+
+    connection.execute('''
+        CREATE TABLE calorie_log_v2 (
+            id INTEGER PRIMARY KEY,
+            dish_id INTEGER NOT NULL,
+            grams REAL NOT NULL,
+            calories REAL NOT NULL,
+            date TEXT NOT NULL,
+            FOREIGN KEY(dish_id) REFERENCES dishes(id)
+        )
+    ''')
+    connection.execute('''
+        INSERT INTO calorie_log_v2 (id, dish_id, grams, calories, date)
+        SELECT cl.id, d.id, cl.grams, cl.calories, cl.date
+        FROM calorie_log cl
+        JOIN dishes_v2 d ON d.name = cl.dish_name
+    ''')
+
+    connection.execute('DROP TABLE calorie_log')
+    connection.execute('DROP TABLE dishes')
+    connection.execute('ALTER TABLE dishes_v2 RENAME TO dishes')
+    connection.execute('ALTER TABLE calorie_log_v2 RENAME TO calorie_log')
+
+    connection.execute('CREATE UNIQUE INDEX idx_dishes_name ON dishes(name)')
+    # Покрывающие индексы: выборки по дате и удаление/пересчет по блюду
+    connection.execute('CREATE INDEX idx_calorie_log_date ON calorie_log(date, dish_id, grams)')
+    connection.execute('CREATE INDEX idx_calorie_log_dish ON calorie_log(dish_id, date, grams)')
+
+
+def _daily_totals(connection):
+    # Материализованные суммы КБЖУ по дням, поддерживаются классом Database
+    connection.execute('''
+        CREATE TABLE daily_totals (
+            date TEXT PRIMARY KEY,
+            kcal REAL NOT NULL,
+            proteins REAL NOT NULL,
+            fats REAL NOT NULL,
+            carbs REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    connection.execute('''
+        INSERT INTO daily_totals (date, kcal, proteins, fats, carbs)
+        SELECT
+            cl.date,
+            SUM(cl.grams * (d.kcal / 100)),
+            SUM(cl.grams * (d.proteins / 100)),
+            SUM(cl.grams * (d.fats / 100)),
+            SUM(cl.grams * (d.carbs / 100))
+        FROM calorie_log cl
+        JOIN dishes d ON d.id = cl.dish_id
+        GROUP BY cl.date
+    ''')
+
+
+def _log_macros(connection):
+    # КБЖУ каждой записи журнала фиксируются в момент добавления, чтобы
+    # изменение блюда не меняло историю. calories уже хранил ккал на момент
+    # записи; белки, жиры и углеводы восстанавливаем по текущим значениям блюд.
+    connection.execute('''
+        CREATE TABLE calorie_log_v4 (
+            id INTEGER PRIMARY KEY,
+            dish_id INTEGER NOT NULL,
+            grams REAL NOT NULL,
+            calories REAL NOT NULL,
+            proteins REAL NOT NULL,
+            fats REAL NOT NULL,
+            carbs REAL NOT NULL,
+            date TEXT NOT NULL,
+            FOREIGN KEY(dish_id) REFERENCES dishes(id)
+        )
+    ''')
+    connection.execute('''
+        INSERT INTO calorie_log_v4 (id, dish_id, grams, calories, proteins, fats, carbs, date)
+        SELECT cl.id, cl.dish_id, cl.grams, cl.calories,
+               cl.grams * (d.proteins / 100), cl.grams * (d.fats / 100), cl.grams * (d.carbs / 100), cl.date
+        FROM calorie_log cl
+        JOIN dishes d ON d.id = cl.dish_id
+    ''')
+    connection.execute('DROP TABLE calorie_log')
+    connection.execute('ALTER TABLE calorie_log_v4 RENAME TO calorie_log')
+    # Суммы по дню считаются по одному индексу, без обращения к таблице
+    connection.execute('CREATE INDEX idx_calorie_log_date ON calorie_log(date, calories, proteins, fats, carbs)')
+    connection.execute('CREATE INDEX idx_calorie_log_dish ON calorie_log(dish_id, date)')
+
+    # Раньше ккал в суммах брались из текущих значений блюд, теперь - из журнала
+    connection.execute('DELETE FROM daily_totals')
+    connection.execute('''
+        INSERT INTO daily_totals (date, kcal, proteins, fats, carbs)
+        SELECT date, SUM(calories), SUM(proteins), SUM(fats), SUM(carbs)
+        FROM calorie_log
+        GROUP BY date
+    ''')
+
+
+def _recipes(connection):
+    # Рецепт - обычное блюдо (КБЖУ на 100 г посчитаны заранее), у которого
+    # есть состав: какие блюда и сколько граммов в него входят
+    connection.execute('''
+        CREATE TABLE recipe_items (
+            id INTEGER PRIMARY KEY,
+            recipe_id INTEGER NOT NULL,
+            dish_id INTEGER NOT NULL,
+            grams REAL NOT NULL,
+            FOREIGN KEY(recipe_id) REFERENCES dishes(id),
+            FOREIGN KEY(dish_id) REFERENCES dishes(id)
+        )
+    ''')
+    connection.execute('CREATE INDEX idx_recipe_items_recipe ON recipe_items(recipe_id)')
+    connection.execute('CREATE INDEX idx_recipe_items_dish ON recipe_items(dish_id)')
+
+
+def _archives(connection):
+    # Закрытые годы, перенесенные в архивные файлы (см. archive.py). batch -
+    # номер последнего завершенного переноса в архив этого года.
+    connection.execute('''
+        CREATE TABLE archives (
+            year INTEGER PRIMARY KEY,
+            file TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            batch INTEGER NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+
+
+def _monthly_dish_totals(connection):
+    # Вклад блюд в КБЖУ по закончившимся месяцам (см. period_stats.py);
+    # в monthly_stats - месяцы, для которых вклад уже посчитан. Название
+    # блюда хранится на случай, если блюдо есть только в архиве.
+    connection.execute('''
+        CREATE TABLE monthly_dish_totals (
+            month TEXT NOT NULL,
+            dish_id INTEGER NOT NULL,
+            dish_name TEXT NOT NULL,
+            kcal REAL NOT NULL,
+            proteins REAL NOT NULL,
+            fats REAL NOT NULL,
+            carbs REAL NOT NULL,
+            grams REAL NOT NULL,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (month, dish_id)
+        ) WITHOUT ROWID
+    ''')
+    connection.execute('''
+        CREATE TABLE monthly_stats (
+            month TEXT PRIMARY KEY,
+            computed_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def _monthly_totals_by_name(connection):
+    # Строки кэша по названию блюда: dish_id есть только у строк с записями
+    # основной базы, строки только из архива хранятся с dish_id NULL (id
+    # удаленного блюда SQLite может выдать новому блюду). При архивации года
+    # его месяцы забываются и считаются заново по архиву. Старый кэш мог
+    # приписать архивные записи не тому блюду, он считается заново.
+    connection.execute('DROP TABLE monthly_dish_totals')
+    connection.execute('''
+        CREATE TABLE monthly_dish_totals (
+            month TEXT NOT NULL,
+            dish_id INTEGER,
+            dish_name TEXT NOT NULL,
+            kcal REAL NOT NULL,
+            proteins REAL NOT NULL,
+            fats REAL NOT NULL,
+            carbs REAL NOT NULL,
+            grams REAL NOT NULL,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (month, dish_name)
+        ) WITHOUT ROWID
+    ''')
+    connection.execute('DELETE FROM monthly_stats')
+
+
+MIGRATIONS = [
+    (1, _initial_schema),
+    (2, _dish_id_foreign_key),
+    (3, _daily_totals),
+    (4, _log_macros),
+    (5, _recipes),
+    (6, _archives),
+    (7, _monthly_dish_totals),
+    (8, _monthly_totals_by_name),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection):
+    connection.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    row = connection.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] if row[0] is not None else 0
+
+
+def migrate(connection):
+    current = get_schema_version(connection)
+    pending = [(version, step) for version, step in MIGRATIONS if version > current]
+    if not pending:
+        return current
+
+    # Пересборка таблиц требует отключенных внешних ключей; PRAGMA нельзя
+    # менять внутри транзакции, поэтому переключаем его снаружи.
+    foreign_keys = connection.execute('PRAGMA foreign_keys').fetchone()[0]
+    connection.execute('PRAGMA foreign_keys = OFF')
+    try:
+        connection.execute('BEGIN')
+        try:
+            for version, step in pending:
+                step(connection)
+                connection.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+            violations = connection.execute('PRAGMA foreign_key_check').fetchall()
+            if violations:
+                raise sqlite3.IntegrityError(f"Нарушены внешние ключи после миграции: {violations[:5]}")
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+    finally:
+        connection.execute(f'PRAGMA foreign_keys = {"ON" if foreign_keys else "OFF"}')
+
+    return pending[-1][0]
@@ -0,0 +1,265 @@
+import calendar
+from datetime import date, datetime, timedelta
+from itertools import groupby
+
+import numpy as np
+
+from archive import attach_archives
+
+# Скользящие средние, которые считаются для периода, в днях
+ROLLING_WINDOWS = (7, 30)
+PERCENTILES = (10, 25, 50, 75, 90)
+# Ккал в грамме белков, жиров и углеводов (для долей в калорийности)
+KCAL_PER_GRAM = np.array([4, 9, 4])
+MACROS = (
+    ('proteins', "белки"),
+    ('fats', "жиры"),
+    ('carbs', "углеводы"),
+)
+TOP_DISHES = 20
+
+
+def bucket_starts(dates, bucket):
+    # dates - массив datetime64[D]; возвращает начало корзины для каждой даты
+    if bucket == 'day':
+        return dates
+    if bucket == 'week':
+        # 1970-01-01 - четверг, сдвигаем так, чтобы неделя начиналась с понедельника
+        days = dates.astype(np.int64)
+        return ((days + 3) // 7 * 7 - 3).astype('datetime64[D]')
+    if bucket == 'month':
+        return dates.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f"Неизвестная агрегация: {bucket}")
+
+
+def aggregate(dates, values, bucket):
+    # Среднее за день внутри каждой корзины (по дням с записями);
+    # values - массив формы (число дней, число показателей)
+    starts = bucket_starts(dates, bucket)
+    if bucket == 'day':
+        return starts, values
+    keys, inverse = np.unique(starts, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(keys))
+    sums = np.zeros((len(keys), values.shape[1]))
+    np.add.at(sums, inverse, values)
+    return keys, sums / counts[:, None]
+
+
+def rolling_mean(dates, values, window):
+    # Скользящее среднее за window календарных дней по дням с записями
+    if len(dates) == 0:
+        return dates, values
+    first = dates[0]
+    offsets = (dates - first).astype(np.int64)
+    grid = np.arange(offsets[-1] + 1)
+    filled = np.zeros((len(grid), values.shape[1]))
+    present = np.zeros(len(grid))
+    filled[offsets] = values
+    present[offsets] = 1
+    value_sums = np.cumsum(filled, axis=0)
+    count_sums = np.cumsum(present)
+    value_sums[window:] = value_sums[window:] - value_sums[:-window]
+    count_sums[window:] = count_sums[window:] - count_sums[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = value_sums / count_sums[:, None]
+    return first + grid.astype('timedelta64[D]'), means
+
+
+def macro_ratio_percentiles(values):
+    # Перцентили доли ккал из белков, жиров и углеводов по дням с записями:
+    # {'proteins': (p10, p25, ...), ...}
+    kcal = values[:, 0]
+    logged = kcal > 0
+    if not logged.any():
+        return {}
+    ratios = values[logged, 1:] * KCAL_PER_GRAM / kcal[logged, None]
+    percentiles = np.percentile(ratios, PERCENTILES, axis=0)
+    return {name: tuple(percentiles[:, index]) for index, (name, _) in enumerate(MACROS)}
+
+
+class PeriodStats:
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        # Дни с записями (datetime64[D]) и их КБЖУ, форма (дней, 4)
+        self.dates = np.array([], dtype='datetime64[D]')
+        self.values = np.zeros((0, 4))
+        # (начала недель или месяцев, среднее КБЖУ за день)
+        self.weekly = None
+        self.monthly = None
+        # {окно в днях: (дни, скользящее среднее КБЖУ)}
+        self.rolling = {}
+        self.ratio_percentiles = {}
+        # (место, название, ккал, белки, жиры, углеводы, граммы, записей, доля ккал)
+        self.dishes = []
+
+    def days_total(self):
+        return (date.fromisoformat(self.end_date) - date.fromisoformat(self.start_date)).days + 1
+
+    def summary(self):
+        lines = [f"Период {self.start_date} — {self.end_date}: дней с записями {len(self.dates)} "
+                 f"из {self.days_total()}"]
+        if len(self.dates):
+            kcal, proteins, fats, carbs = self.values.mean(axis=0)
+            lines.append(f"Среднее за день: {kcal:.0f} ккал, Б {proteins:.1f} г, Ж {fats:.1f} г, У {carbs:.1f} г")
+        for name, label in MACROS:
+            percentiles = self.ratio_percentiles.get(name)
+            if percentiles is not None:
+                values = ', '.join(f"{value:.0%}" for value in percentiles)
+                lines.append(f"Доля ккал ({label}), перцентили {'/'.join(map(str, PERCENTILES))}: {values}")
+        return '\n'.join(lines)
+
+
+def compute_period_stats(db, start_date, end_date, top_dishes=TOP_DISHES):
+    # Средние по неделям и месяцам, скользящие средние, доли БЖУ и вклад
+    # блюд за период; подходит для DatabaseWorker.submit (функция от db)
+    if start_date > end_date:
+        raise ValueError("Начало периода позже его конца")
+    stats = PeriodStats(start_date, end_date)
+    rows = db.get_calorie_data_by_date_range(start_date, end_date)
+    if rows:
+        stats.dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+        stats.values = np.array([row[1:] for row in rows], dtype=float)
+    stats.weekly = aggregate(stats.dates, stats.values, 'week')
+    stats.monthly = aggregate(stats.dates, stats.values, 'month')
+    stats.rolling = {window: rolling_mean(stats.dates, stats.values, window) for window in ROLLING_WINDOWS}
+    stats.ratio_percentiles = macro_ratio_percentiles(stats.values)
+    stats.dishes = dish_ranking(db, start_date, end_date, top_dishes)
+    return stats
+
+
+def month_bounds(month):
+    year, number = int(month[:4]), int(month[5:7])
+    return f'{month}-01', f'{month}-{calendar.monthrange(year, number)[1]:02d}'
+
+
+def _months_between(start_date, end_date):
+    year, number = int(start_date[:4]), int(start_date[5:7])
+    months = []
+    while f'{year:04d}-{number:02d}' <= end_date[:7]:
+        months.append(f'{year:04d}-{number:02d}')
+        year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return months
+
+
+def _shift(day, days):
+    return (date.fromisoformat(day) + timedelta(days=days)).isoformat()
+
+
+def _log_sources(archives):
+    # Записи журнала основной базы и подключенных архивов в одном виде;
+    # параметры каждого источника - начало и конец периода (и batch архива).
+    # Архивная запись относится к блюду только по сохраненному названию:
+    # ее dish_id мог после удаления блюда достаться другому блюду
+    sources = ['''
+        SELECT cl.date, cl.dish_id, d.name AS dish_name, cl.calories, cl.proteins, cl.fats, cl.carbs, cl.grams
+        FROM main.calorie_log cl
+        JOIN main.dishes d ON d.id = cl.dish_id
+        WHERE cl.date BETWEEN ? AND ?
+    ''']
+    sources += [f'''
+        SELECT date, NULL AS dish_id, dish_name, calories, proteins, fats, carbs, grams
+        FROM {schema}.calorie_log
+        WHERE date BETWEEN ? AND ? AND batch <= {int(batch)}
+    ''' for schema, batch in archives]
+    return sources
+
+
+def _fill_monthly_dish_totals(db, months):
+    # Считает вклад блюд за закончившиеся месяцы, которых еще нет в кэше;
+    # по году за транзакцию, так как архивы подключаются вне транзакции
+    connection = db.connection
+    cached = {row[0] for row in connection.execute('SELECT month FROM monthly_stats WHERE month BETWEEN ? AND ?',
+                                                   (months[0], months[-1]))}
+    missing = [month for month in months if month not in cached]
+    for _, year_months in groupby(missing, key=lambda month: month[:4]):
+        year_months = list(year_months)
+        start_date, end_date = month_bounds(year_months[0])[0], month_bounds(year_months[-1])[1]
+        span = _months_between(start_date, end_date)
+        archives = attach_archives(connection, db.config, [(start_date, end_date)])
+        sources = _log_sources(archives)
+        # Запись захватывается сразу: журнал не должен измениться между
+        # чтением и сохранением результата
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM monthly_dish_totals WHERE month BETWEEN ? AND ?', (span[0], span[-1]))
+            connection.execute(f'''
+                INSERT INTO monthly_dish_totals
+                    (month, dish_id, dish_name, kcal, proteins, fats, carbs, grams, entries)
+                SELECT substr(date, 1, 7), MAX(dish_id), dish_name,
+                       SUM(calories), SUM(proteins), SUM(fats), SUM(carbs), SUM(grams), COUNT(*)
+                FROM ({' UNION ALL '.join(sources)})
+                GROUP BY 1, 3
+            ''', (start_date, end_date) * len(sources))
+            computed_at = datetime.now().isoformat(timespec='seconds')
+            connection.executemany('INSERT OR REPLACE INTO monthly_stats (month, computed_at) VALUES (?, ?)',
+                                   [(month, computed_at) for month in span])
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+
+def dish_ranking(db, start_date, end_date, limit=TOP_DISHES):
+    # Вклад блюд в ккал за период с местом и долей (оконные функции по
+    # кэшу закончившихся месяцев и записям журнала за остальные дни)
+    current_month = date.today().strftime('%Y-%m')
+    covered = [month for month in _months_between(start_date, end_date)
+               if month < current_month and month_bounds(month)[0] >= start_date
+               and month_bounds(month)[1] <= end_date]
+    if covered:
+        _fill_monthly_dish_totals(db, covered)
+        first_day, last_day = month_bounds(covered[0])[0], month_bounds(covered[-1])[1]
+        periods = []
+        if start_date < first_day:
+            periods.append((start_date, _shift(first_day, -1)))
+        if end_date > last_day:
+            periods.append((_shift(last_day, 1), end_date))
+    else:
+        periods = [(start_date, end_date)]
+
+    connection = db.connection
+    archives = attach_archives(connection, db.config, periods)
+    parts, params = [], []
+    if covered:
+        parts.append('''
+            SELECT dish_id, dish_name, SUM(kcal), SUM(proteins), SUM(fats), SUM(carbs), SUM(grams), SUM(entries)
+            FROM monthly_dish_totals
+            WHERE month BETWEEN ? AND ?
+            GROUP BY dish_id, dish_name
+        ''')
+        params += [covered[0], covered[-1]]
+    for period in periods:
+        sources = _log_sources(archives)
+        parts += [f'''
+            SELECT dish_id, dish_name, calories, proteins, fats, carbs, grams, 1
+            FROM ({source})
+        ''' for source in sources]
+        params += list(period) * len(sources)
+
+    # Текущие названия блюд подставляются после группировки (в кэше могло
+    # остаться название до переименования); архивные записи без dish_id
+    # остаются под своим названием и совпадают с блюдом, только если оно
+    # называется так же
+    cursor = connection.execute(f'''
+        WITH pieces (dish_id, dish_name, kcal, proteins, fats, carbs, grams, entries) AS (
+            {' UNION ALL '.join(parts)}
+        ),
+        totals AS (
+            SELECT dish_id, dish_name, SUM(kcal) AS kcal, SUM(proteins) AS proteins,
+                   SUM(fats) AS fats, SUM(carbs) AS carbs, SUM(grams) AS grams, SUM(entries) AS entries
+            FROM pieces
+            GROUP BY dish_id, dish_name
+        )
+        SELECT
+            RANK() OVER (ORDER BY SUM(t.kcal) DESC) AS place,
+            COALESCE(d.name, t.dish_name),
+            SUM(t.kcal), SUM(t.proteins), SUM(t.fats), SUM(t.carbs), SUM(t.grams), SUM(t.entries),
+            SUM(t.kcal) / SUM(SUM(t.kcal)) OVER () AS share
+        FROM totals t
+        LEFT JOIN main.dishes d ON d.id = t.dish_id
+        GROUP BY COALESCE(d.name, t.dish_name)
+        ORDER BY place
+        LIMIT ?
+    ''', (*params, limit))
+    return cursor.fetchall()
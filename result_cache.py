@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+
+# Сколько последних сбросов помнить для проверки версии при put; если чтение
+# длилось дольше, чем произошло столько сбросов, его результат не кэшируется
+INVALIDATION_LOG_SIZE = 256
+
+
+class ResultCache:
+    # LRU-кэш результатов чтения КБЖУ с ограничением по числу записей и по
+    # памяти. Ключ - ('day', дата) или ('range', начало, конец).
+    #
+    # Версия кэша растет при каждом сбросе. Читатель запоминает версию до
+    # запроса к базе и передает ее в put: если за это время были сброшены
+    # даты, которые задевает ключ, результат мог устареть и не сохраняется.
+
+    def __init__(self, max_entries=512, max_bytes=4 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._version = 0
+        self._log = deque(maxlen=INVALIDATION_LOG_SIZE)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self, key):
+        # Возвращает (найдено, значение)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value, version):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if self._stale(key, version):
+                self.rejected += 1
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate_dates(self, dates):
+        # Сбрасывает записи за эти дни и диапазоны, в которые они попадают
+        dates = set(dates)
+        if not dates:
+            return
+        low, high = min(dates), max(dates)
+        with self._lock:
+            self._version += 1
+            self._log.append((self._version, dates, low, high))
+            for key in [key for key in self._entries if _touches(key, dates, low, high)]:
+                self._bytes -= self._entries.pop(key)[1]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._log.append((self._version, None, None, None))
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'rejected': self.rejected,
+            }
+
+    def _stale(self, key, version):
+        if version == self._version:
+            return False
+        if not self._log or self._log[0][0] > version + 1:
+            # Журнал сбросов уже не покрывает время чтения
+            return True
+        for logged_version, dates, low, high in self._log:
+            if logged_version > version and (dates is None or _touches(key, dates, low, high)):
+                return True
+        return False
+
+
+def _touches(key, dates, low, high):
+    if key[0] == 'day':
+        return key[1] in dates
+    start, end = key[1], key[2]
+    # Быстрая проверка по границам, точная - только при пересечении
+    if high < start or low > end:
+        return False
+    return any(start <= date <= end for date in dates)
+
+
+def _estimate_size(value):
+    # Приблизительный размер результата в памяти: контейнер, строки и значения
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for row in value:
+            size += sys.getsizeof(row)
+            if isinstance(row, tuple):
+                size += sum(sys.getsizeof(item) for item in row)
+    return size
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_cache(path, max_entries, max_bytes):
+    # Один кэш на файл базы для всех экземпляров Database в процессе:
+    # запись через одно соединение сбрасывает кэш и для остальных
+    if path == ':memory:':
+        return ResultCache(max_entries, max_bytes)
+    key = os.path.abspath(path)
+    with _shared_lock:
+        cache = _shared.get(key)
+        if cache is None:
+            cache = _shared[key] = ResultCache(max_entries, max_bytes)
+        return cache
@@ -1,4 +1,6 @@
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLineEdit, QPushButton, QListWidget, QMessageBox, QFormLayout
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLineEdit, QPushButton, QListView, QMessageBox, QFormLayout
+
+from dish_list_model import DishListModel
 
 class SearchEditDialog(QDialog):
     def __init__(self, parent=None):
@@ -11,7 +13,10 @@ class SearchEditDialog(QDialog):
         self.search_line.setPlaceholderText("Введите название блюда для поиска")
         layout.addWidget(self.search_line)
 
-        self.dish_list = QListWidget(self)
+        self.dish_model = DishListModel(self.parent().db, self)
+        self.dish_list = QListView(self)
+        self.dish_list.setUniformItemSizes(True)
+        self.dish_list.setModel(self.dish_model)
         layout.addWidget(self.dish_list)
 
         self.search_line.textChanged.connect(self.update_dish_list)
@@ -25,31 +30,25 @@ class SearchEditDialog(QDialog):
         layout.addWidget(self.delete_button)
 
         self.setLayout(layout)
-        self.populate_dish_list()
 
     def populate_dish_list(self):
-        self.dish_list.clear()
-        dishes = self.parent().db.get_dishes()
-        for dish in dishes:
-            name, _, _, _, _ = dish
-            self.dish_list.addItem(name)
+        self.update_dish_list()
 
     def update_dish_list(self):
-        search_text = self.search_line.text().lower()
-        self.dish_list.clear()
-        dishes = self.parent().db.get_dishes()
-        for dish in dishes:
-            name, _, _, _, _ = dish
-            if search_text in name.lower():
-                self.dish_list.addItem(name)
+        search_text = self.search_line.text()
+        db_worker = self.parent().db_worker
+        if not search_text.strip():
+            db_worker.cancel('edit_dialog_search')
+            self.dish_model.setMatches(None)
+            return
+        db_worker.submit('edit_dialog_search', 'search_dishes', search_text, callback=self.dish_model.setMatches)
 
     def open_edit_dish_dialog(self):
-        selected_item = self.dish_list.currentItem()
-        if not selected_item:
+        dish_name = self.dish_model.name_at(self.dish_list.currentIndex())
+        if not dish_name:
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, выберите блюдо из списка")
             return
 
-        dish_name = selected_item.text()
         dish_data = self.parent().db.get_dish(dish_name)
         if not dish_data:
             QMessageBox.warning(self, "Ошибка", "Не удалось получить данные блюда")
@@ -61,12 +60,11 @@ class SearchEditDialog(QDialog):
             self.accept()
 
     def delete_dish(self):
-        selected_item = self.dish_list.currentItem()
-        if not selected_item:
+        dish_name = self.dish_model.name_at(self.dish_list.currentIndex())
+        if not dish_name:
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, выберите блюдо из списка")
             return
 
-        dish_name = selected_item.text()
         reply = QMessageBox.question(self, "Подтверждение", f"Вы уверены, что хотите удалить блюдо '{dish_name}'?",
                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
@@ -83,6 +81,7 @@ class EditDishDialog(QDialog):
 
         self.db = db
         self.dish_name = dish_name
+        self.dish_data = tuple(dish_data)
 
         layout = QFormLayout()
 
@@ -120,6 +119,21 @@ class EditDishDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", "Некорректные данные")
             return
 
-        self.db.update_dish(self.dish_name, name, kcal, proteins, fats, carbs)
+        try:
+            self.db.update_dish(self.dish_name, name, kcal, proteins, fats, carbs)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
+
+        # Уже записанные приемы пищи сохраняют прежние КБЖУ, если не пересчитать их явно
+        if (kcal, proteins, fats, carbs) != self.dish_data:
+            reply = QMessageBox.question(self, "Пересчет истории",
+                                         "Пересчитать уже записанные приемы пищи с этим блюдом по новым значениям?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply == QMessageBox.Yes:
+                updated = self.db.recalculate_history(name)
+                QMessageBox.information(self, "Успех", f"Изменения сохранены, пересчитано записей: {updated}")
+                self.accept()
+                return
         QMessageBox.information(self, "Успех", "Изменения сохранены!")
         self.accept()
\ No newline at end of file
@@ -0,0 +1,354 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from db import Database
+from storage import default_config
+
+# Локальный сервис, который один владеет записью в базу, когда с одним
+# calories.db работают несколько человек. Клиенты (приложения, запущенные с
+# --service, и service_client.ServiceClient) шлют по сокету строки JSON:
+#   {"id": 1, "method": "track_calories", "params": ["Гречка", 150, "2024-03-01"]}
+# и получают {"id": 1, "result": ...} или {"id": 1, "error": "..."}. После
+# {"method": "subscribe"} (в ответе - путь к базе) клиенту приходят уведомления:
+#   {"event": "log_changed", "dates": [...], "macros": [...]}
+#   {"event": "dishes_changed", "action": "added", "dish_id": 5, "name": "..."}
+#
+# Запись идет через одно соединение по очереди. Записи приемов пищи, которые
+# накопились, пока шла предыдущая транзакция, фиксируются одной транзакцией
+# (Database.track_meals). Чтение выполняется параллельно в пуле потоков, у
+# каждого потока свое соединение. Изменения, записанные в базу в обход
+# сервиса (импорт в приложении, cli.py, db.py), сервис замечает по
+# PRAGMA data_version: кэш сбрасывается, клиенты получают уведомления.
+
+READ_METHODS = {'get_data_by_date', 'get_calorie_data_by_date_range', 'get_dishes', 'search_dishes', 'get_dish',
+                'get_recipe_items', 'suggest_dishes'}
+WRITE_METHODS = {'track_calories', 'track_meal', 'save_recipe', 'add_dish', 'update_dish', 'delete_dish',
+                 'recalculate_history'}
+# Записи журнала, которые можно объединять в одну транзакцию
+GROUPED_METHODS = {'track_calories', 'track_meal'}
+
+READER_THREADS = 4
+MAX_BATCH = 256
+# Как часто проверять, не изменил ли базу кто-то помимо сервиса, с
+EXTERNAL_CHECK_INTERVAL = 0.5
+# Строка запроса или ответа не длиннее (ответ на get_dishes может быть большим)
+LINE_LIMIT = 64 * 1024 * 1024
+DEFAULT_PORT = 8765
+
+
+def default_address(db_path):
+    # Unix-сокет рядом с базой, где они есть, иначе порт на localhost
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.abspath(db_path) + '.sock'
+    return f'127.0.0.1:{DEFAULT_PORT}'
+
+
+def parse_address(address):
+    # 'хост:порт' - TCP, иначе путь к Unix-сокету; возвращает (хост, порт) или путь
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def _to_json(value):
+    # Числа NumPy (в результатах suggest_dishes)
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Не сериализуется в JSON: {type(value).__name__}")
+
+
+def encode(message):
+    return json.dumps(message, ensure_ascii=False, default=_to_json).encode('utf-8') + b'\n'
+
+
+def _as_meal(method, params):
+    if method == 'track_calories':
+        dish_name, grams, date = params
+        return [(dish_name, grams)], date
+    items, date = params
+    return [tuple(item) for item in items], date
+
+
+class _Readers:
+    # Пул потоков чтения; у каждого потока свой Database. Каталог блюд и
+    # матрица подбора в этих экземплярах меняются только в их потоке, поэтому
+    # уведомления об изменении блюд копятся и применяются перед запросом.
+
+    def __init__(self, config, size):
+        self.config = config.replace(reader_pool_size=0)
+        self.executor = ThreadPoolExecutor(size, thread_name_prefix='ServiceReader')
+        self._local = threading.local()
+        self._pending = []
+        self._databases = []
+        self._lock = threading.Lock()
+
+    def _database(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = Database(config=self.config)
+            self._local.pending = deque()
+            with self._lock:
+                self._databases.append(db)
+                self._pending.append(self._local.pending)
+        pending = self._local.pending
+        while pending:
+            db._notify_dishes_changed(*pending.popleft())
+        return db
+
+    def call(self, method, params):
+        return getattr(self._database(), method)(*params)
+
+    def dishes_changed(self, action, dish_id=None, name=None):
+        with self._lock:
+            for pending in self._pending:
+                pending.append((action, dish_id, name))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for db in self._databases:
+            db.close()
+
+
+class CalorieService:
+    def __init__(self, config=None, readers=READER_THREADS, max_batch=MAX_BATCH, group_commit_ms=0):
+        self.config = config or default_config()
+        self.max_batch = max_batch
+        # Сколько ждать новых записей после первой в группе; 0 - группа из
+        # того, что накопилось за время предыдущей транзакции
+        self.group_commit_delay = group_commit_ms / 1000
+        self.readers = _Readers(self.config, readers)
+        # Соединение записи создается и используется в одном потоке
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix='ServiceWriter')
+        self.db = None
+        self.loop = None
+        self._writes = None
+        self._data_version = None
+        self._subscribers = set()
+        self.clients = 0
+        self.writes = 0
+        self.commits = 0
+        self.external_changes = 0
+
+    async def start(self, address):
+        self.loop = asyncio.get_running_loop()
+        self._writes = asyncio.Queue()
+        self.db = await self.loop.run_in_executor(self.writer, self._open_database)
+        target = parse_address(address)
+        if isinstance(target, tuple):
+            server = await asyncio.start_server(self._serve_client, *target, limit=LINE_LIMIT)
+        else:
+            if os.path.exists(target):
+                os.remove(target)
+            server = await asyncio.start_unix_server(self._serve_client, target, limit=LINE_LIMIT)
+        self._write_task = asyncio.create_task(self._write_loop())
+        self._watch_task = asyncio.create_task(self._watch_loop())
+        return server
+
+    def _open_database(self):
+        db = Database(config=self.config.replace(reader_pool_size=0))
+        db.add_log_listener(self._log_changed)
+        db.add_dishes_listener(self._dishes_changed)
+        self._data_version = db.connection.execute('PRAGMA data_version').fetchone()[0]
+        return db
+
+    def close(self):
+        self._write_task.cancel()
+        self._watch_task.cancel()
+        self.writer.submit(self.db.close).result()
+        self.writer.shutdown()
+        self.readers.close()
+
+    # Уведомления приходят из потока записи
+    def _log_changed(self, dates, macros):
+        self.loop.call_soon_threadsafe(self._broadcast, {
+            'event': 'log_changed', 'dates': dates, 'macros': list(macros) if macros is not None else None})
+
+    def _dishes_changed(self, action, dish_id=None, name=None):
+        self.readers.dishes_changed(action, dish_id, name)
+        self.loop.call_soon_threadsafe(self._broadcast, {
+            'event': 'dishes_changed', 'action': action, 'dish_id': dish_id, 'name': name})
+
+    def _broadcast(self, message):
+        line = encode(message)
+        for writer in list(self._subscribers):
+            if writer.is_closing():
+                self._subscribers.discard(writer)
+            else:
+                writer.write(line)
+
+    async def _serve_client(self, reader, writer):
+        self.clients += 1
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not line:
+                    break
+                # Запросы одного клиента выполняются параллельно, ответы
+                # приходят по мере готовности и различаются по id
+                task = asyncio.create_task(self._answer(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            self.clients -= 1
+            self._subscribers.discard(writer)
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _answer(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            result = await self.dispatch(request.get('method'), request.get('params') or [], writer)
+            response = {'id': request_id, 'result': result}
+        except ValueError as error:
+            response = {'id': request_id, 'error': str(error)}
+        except Exception as error:
+            response = {'id': request_id, 'error': f"{type(error).__name__}: {error}"}
+        if not writer.is_closing():
+            writer.write(encode(response))
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, method, params, writer=None):
+        if method in READ_METHODS:
+            return await self.loop.run_in_executor(self.readers.executor, self.readers.call, method, params)
+        if method in WRITE_METHODS:
+            future = self.loop.create_future()
+            self._writes.put_nowait((method, params, future))
+            return await future
+        if method == 'subscribe':
+            # Клиент сверяет путь со своей базой
+            self._subscribers.add(writer)
+            return os.path.realpath(self.config.path)
+        if method == 'stats':
+            return {'clients': self.clients, 'subscribers': len(self._subscribers), 'writes': self.writes,
+                    'commits': self.commits, 'external_changes': self.external_changes,
+                    'queued': self._writes.qsize()}
+        raise ValueError(f"Неизвестный метод: {method}")
+
+    async def _write_loop(self):
+        held = None
+        while True:
+            first = held or await self._writes.get()
+            held = None
+            batch = [first]
+            if first[0] in GROUPED_METHODS:
+                deadline = self.loop.time() + self.group_commit_delay
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._writes.get_nowait()
+                    except asyncio.QueueEmpty:
+                        timeout = deadline - self.loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            item = await asyncio.wait_for(self._writes.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    if item[0] not in GROUPED_METHODS:
+                        held = item
+                        break
+                    batch.append(item)
+            try:
+                results = await self.loop.run_in_executor(self.writer, self._commit, [item[:2] for item in batch])
+            except Exception as error:
+                # Цикл записи не должен останавливаться: ошибку получает только эта группа
+                results = [(False, f"{type(error).__name__}: {error}")] * len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(ValueError(value))
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(EXTERNAL_CHECK_INTERVAL)
+            await self.loop.run_in_executor(self.writer, self._check_external_changes)
+
+    def _check_external_changes(self):
+        # Выполняется в потоке записи. data_version меняется, только когда
+        # базу изменило другое соединение; что именно изменилось, неизвестно,
+        # поэтому кэш сбрасывается за все дни, а каталоги блюд - целиком
+        version = self.db.connection.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        self.external_changes += 1
+        self.db._log_changed(None)
+        self.db._notify_dishes_changed('reset')
+
+    def _commit(self, batch):
+        # Выполняется в потоке записи; возвращает [(успех, результат или текст ошибки)]
+        self._check_external_changes()
+        self.writes += len(batch)
+        if len(batch) > 1:
+            try:
+                calories = self.db.track_meals([_as_meal(method, params) for method, params in batch])
+                self.commits += 1
+                return [(True, value) for value in calories]
+            except Exception:
+                # Ошибка в одной из записей или занятая другим процессом база
+                # (database is locked): остальные записи не должны из-за нее
+                # пропасть, поэтому они выполняются по одной
+                pass
+        results = []
+        for method, params in batch:
+            try:
+                results.append((True, getattr(self.db, method)(*params)))
+            except Exception as error:
+                message = str(error) if isinstance(error, ValueError) else f"{type(error).__name__}: {error}"
+                results.append((False, message))
+            self.commits += 1
+        return results
+
+
+async def serve(address, config=None, **options):
+    service = CalorieService(config, **options)
+    server = await service.start(address)
+    print(f"Сервис базы {service.config.path} слушает {address}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+        if not isinstance(parse_address(address), tuple) and os.path.exists(address):
+            os.remove(address)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Локальный сервис базы для нескольких приложений")
+    parser.add_argument('--db', help="файл базы данных (по умолчанию calories.db или переменная CALORIES_DB)")
+    parser.add_argument('--address', help="путь к Unix-сокету или хост:порт (по умолчанию <база>.sock)")
+    parser.add_argument('--readers', type=int, default=READER_THREADS, help="потоков чтения")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH,
+                        help="записей в одной транзакции (1 - без групповой фиксации)")
+    parser.add_argument('--group-commit-ms', type=float, default=0,
+                        help="сколько ждать других записей перед фиксацией группы")
+    args = parser.parse_args()
+
+    from storage import StorageConfig
+
+    config = StorageConfig.from_env(path=args.db) if args.db else default_config()
+    try:
+        asyncio.run(serve(args.address or default_address(config.path), config, readers=args.readers,
+                          max_batch=args.max_batch, group_commit_ms=args.group_commit_ms))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,142 @@
+import itertools
+import json
+import os
+import socket
+import threading
+
+from db import Database
+from service import encode, parse_address
+
+
+class ServiceClient:
+    # Блокирующий клиент сервиса базы (service.py). Вызовы можно делать из
+    # нескольких потоков; ответы и уведомления читает отдельный поток, а
+    # уведомления передаются в on_event(сообщение) из этого потока.
+
+    def __init__(self, address, on_event=None, timeout=30.0):
+        target = parse_address(address)
+        try:
+            if isinstance(target, tuple):
+                self._socket = socket.create_connection(target)
+                self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            else:
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.connect(target)
+        except OSError as error:
+            raise ValueError(f"Не удалось подключиться к сервису базы {address}: {error}")
+        self.on_event = on_event
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        # id запроса -> [событие, ответ]
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._read_responses, name="ServiceClient", daemon=True)
+        self._thread.start()
+
+    def call(self, method, *params):
+        request_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        with self._lock:
+            if self._closed:
+                raise ValueError("Нет связи с сервисом базы")
+            self._pending[request_id] = waiter
+            self._socket.sendall(encode({'id': request_id, 'method': method, 'params': params}))
+        if not waiter[0].wait(self.timeout):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise ValueError(f"Сервис базы не ответил за {self.timeout:.0f} с")
+        response = waiter[1]
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['result']
+
+    def subscribe(self):
+        return self.call('subscribe')
+
+    def _read_responses(self):
+        try:
+            for line in self._socket.makefile('rb'):
+                message = json.loads(line)
+                if 'event' in message:
+                    if self.on_event is not None:
+                        self.on_event(message)
+                    continue
+                with self._lock:
+                    waiter = self._pending.pop(message.get('id'), None)
+                if waiter is not None:
+                    waiter[1] = message
+                    waiter[0].set()
+        except OSError:
+            pass
+        finally:
+            # Соединение закрыто: ожидающие вызовы получают ошибку
+            with self._lock:
+                self._closed = True
+                pending, self._pending = self._pending, {}
+            for waiter in pending.values():
+                waiter[1] = {'error': "Соединение с сервисом базы разорвано"}
+                waiter[0].set()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._thread.join()
+
+
+class ServiceDatabase(Database):
+    # Database, которая пишет через сервис базы, а читает файл сама (в
+    # режиме WAL чтение не мешает записи). Изменения, сделанные любым
+    # клиентом сервиса, приходят уведомлениями: они сбрасывают кэш и
+    # вызывают подписчиков add_log_listener/add_dishes_listener так же, как
+    # запись через это соединение. dispatch(функция) переносит вызов
+    # подписчиков в нужный поток (в приложении - в поток интерфейса).
+
+    def __init__(self, address, path=None, config=None, dispatch=None):
+        super().__init__(path, config)
+        self._dispatch = dispatch or (lambda callback: callback())
+        self.client = ServiceClient(address, self._on_event)
+        service_path = self.client.subscribe()
+        if service_path != os.path.realpath(self.config.path):
+            self.close()
+            raise ValueError(f"Сервис {address} работает с базой {service_path}, а не с {self.config.path}")
+
+    def _on_event(self, message):
+        if message['event'] == 'log_changed':
+            macros = tuple(message['macros']) if message['macros'] is not None else None
+            self._dispatch(lambda: self._log_changed(message['dates'], macros))
+        elif message['event'] == 'dishes_changed':
+            self._dispatch(lambda: self._notify_dishes_changed(message['action'], message['dish_id'],
+                                                               message['name']))
+
+    # Запись - через сервис
+    def add_dish(self, name, kcal, proteins, fats, carbs):
+        return self.client.call('add_dish', name, kcal, proteins, fats, carbs)
+
+    def update_dish(self, old_name, name, kcal, proteins, fats, carbs):
+        return self.client.call('update_dish', old_name, name, kcal, proteins, fats, carbs)
+
+    def delete_dish(self, dish_name):
+        return self.client.call('delete_dish', dish_name)
+
+    def track_calories(self, dish_name, grams, date):
+        return self.client.call('track_calories', dish_name, grams, date)
+
+    def track_meal(self, items, date):
+        return self.client.call('track_meal', items, date)
+
+    def save_recipe(self, name, items):
+        return tuple(self.client.call('save_recipe', name, items))
+
+    def recalculate_history(self, dish_name=None):
+        return self.client.call('recalculate_history', dish_name)
+
+    def close(self):
+        self.client.close()
+        super().close()
+
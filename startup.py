@@ -0,0 +1,32 @@
+import sys
+import time
+
+# Замер времени запуска по этапам: mark(phase) отмечает конец этапа.
+# Пока замер не включен через enable(), mark ничего не делает.
+
+_started = time.perf_counter()
+_phases = []
+_enabled = False
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def mark(phase):
+    if _enabled:
+        _phases.append((phase, time.perf_counter()))
+
+
+def report(file=sys.stderr):
+    previous = _started
+    print("Время запуска по этапам:", file=file)
+    for phase, moment in _phases:
+        print(f"  {phase:<40} {(moment - previous) * 1000:8.1f} мс", file=file)
+        previous = moment
+    print(f"  {'итого':<40} {(previous - _started) * 1000:8.1f} мс", file=file)
@@ -0,0 +1,48 @@
+import numpy as np
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QLabel, QPushButton, QTabWidget, QTableWidget, QTableWidgetItem,
+                             QHeaderView)
+
+DISH_COLUMNS = ("Место", "Блюдо", "Ккал", "Доля ккал", "Б, г", "Ж, г", "У, г", "Граммов", "Записей")
+AVERAGE_COLUMNS = ("Начало", "Ккал в день", "Б, г", "Ж, г", "У, г")
+
+
+class StatsDialog(QDialog):
+    # Результат period_stats.compute_period_stats: сводка, вклад блюд и
+    # средние за день по неделям и месяцам
+    def __init__(self, stats, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Статистика за период")
+        self.resize(800, 600)
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel(stats.summary(), self))
+
+        tabs = QTabWidget(self)
+        dishes = [(place, name, f"{kcal:.0f}", f"{share or 0:.1%}", f"{proteins:.1f}", f"{fats:.1f}",
+                   f"{carbs:.1f}", f"{grams:.0f}", entries)
+                  for place, name, kcal, proteins, fats, carbs, grams, entries, share in stats.dishes]
+        tabs.addTab(self.create_table(DISH_COLUMNS, dishes), "Блюда")
+        tabs.addTab(self.create_table(AVERAGE_COLUMNS, self.average_rows(*stats.weekly)), "По неделям")
+        tabs.addTab(self.create_table(AVERAGE_COLUMNS, self.average_rows(*stats.monthly)), "По месяцам")
+        layout.addWidget(tabs)
+
+        close_button = QPushButton("Закрыть", self)
+        close_button.clicked.connect(self.close)
+        layout.addWidget(close_button)
+
+        self.setLayout(layout)
+
+    def average_rows(self, starts, means):
+        return [(str(start), *(f"{value:.1f}" for value in values))
+                for start, values in zip(np.datetime_as_string(starts), means)]
+
+    def create_table(self, columns, rows):
+        table = QTableWidget(len(rows), len(columns), self)
+        table.setHorizontalHeaderLabels(columns)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.verticalHeader().hide()
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(str(value)))
+        return table
@@ -0,0 +1,161 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_FILE = 'calories.db'
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# Переменные окружения, которыми можно переопределить настройки
+ENVIRONMENT = {
+    'path': ('CALORIES_DB', str),
+    'journal_mode': ('CALORIES_DB_JOURNAL_MODE', str),
+    'synchronous': ('CALORIES_DB_SYNCHRONOUS', str),
+    'cache_size_kib': ('CALORIES_DB_CACHE_KIB', int),
+    'mmap_size': ('CALORIES_DB_MMAP_BYTES', int),
+    'statement_cache_size': ('CALORIES_DB_STATEMENT_CACHE', int),
+    'busy_timeout': ('CALORIES_DB_BUSY_TIMEOUT', float),
+    'reader_pool_size': ('CALORIES_DB_READERS', int),
+    'result_cache_entries': ('CALORIES_DB_RESULT_CACHE', int),
+    'result_cache_bytes': ('CALORIES_DB_RESULT_CACHE_BYTES', int),
+}
+
+
+class StorageConfig:
+    # Настройки файла базы и соединений SQLite. В режиме WAL читатели не
+    # ждут завершения записи, а запись не ждет долгих чтений.
+
+    def __init__(self, path=DB_FILE, journal_mode='WAL', synchronous='NORMAL', cache_size_kib=16384,
+                 mmap_size=256 * 1024 * 1024, statement_cache_size=256, busy_timeout=5.0, reader_pool_size=4,
+                 result_cache_entries=512, result_cache_bytes=4 * 1024 * 1024):
+        journal_mode = journal_mode.upper()
+        synchronous = synchronous.upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Неизвестный режим журнала: {journal_mode}")
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Неизвестный уровень synchronous: {synchronous}")
+        self.path = path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.statement_cache_size = statement_cache_size
+        self.busy_timeout = busy_timeout
+        # База в памяти существует только внутри своего соединения
+        self.reader_pool_size = 0 if path == ':memory:' else reader_pool_size
+        # Кэш результатов чтения КБЖУ (см. result_cache.py); 0 - без кэша
+        self.result_cache_entries = result_cache_entries
+        self.result_cache_bytes = result_cache_bytes
+
+    @classmethod
+    def from_env(cls, **overrides):
+        settings = {}
+        for name, (variable, convert) in ENVIRONMENT.items():
+            value = os.environ.get(variable)
+            if value:
+                try:
+                    settings[name] = convert(value)
+                except ValueError:
+                    raise ValueError(f"Некорректное значение {variable}: {value}")
+        settings.update({name: value for name, value in overrides.items() if value is not None})
+        return cls(**settings)
+
+    def replace(self, **changes):
+        settings = dict(self.__dict__)
+        settings.update(changes)
+        return StorageConfig(**settings)
+
+    def connect(self, read_only=False):
+        if read_only:
+            # Ошибка записи в соединении читателя лучше, чем незаметная запись
+            uri = 'file:' + os.path.abspath(self.path).replace('?', '%3f').replace('#', '%23') + '?mode=ro'
+            connection = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout,
+                                         cached_statements=self.statement_cache_size, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                         cached_statements=self.statement_cache_size)
+            # Режим журнала хранится в самом файле, его задает соединение записи
+            connection.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        connection.execute(f'PRAGMA synchronous = {self.synchronous}')
+        connection.execute(f'PRAGMA cache_size = {-int(self.cache_size_kib)}')
+        connection.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        connection.execute('PRAGMA foreign_keys = ON')
+        return connection
+
+
+class ReaderPool:
+    # Соединения только для чтения, которые потоки берут на время запроса.
+    # Соединения открываются по мере надобности, но не больше size.
+
+    def __init__(self, config, size=None):
+        self.config = config
+        self.size = size or config.reader_pool_size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        # Функции, которые вызываются для каждого нового соединения
+        self.on_connect = []
+
+    @contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+            self._idle.put(connection)
+
+    def _acquire(self):
+        if self._closed:
+            raise ValueError("Пул соединений закрыт")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                opening = True
+            else:
+                opening = False
+        if opening:
+            try:
+                connection = self.config.connect(read_only=True)
+                for callback in self.on_connect:
+                    callback(connection)
+                return connection
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        return self._idle.get()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_default_config = None
+
+
+def default_config():
+    # Настройки по умолчанию для Database(): из переменных окружения
+    # или заданные через set_default_config (например, main.py --db)
+    global _default_config
+    if _default_config is None:
+        _default_config = StorageConfig.from_env()
+    return _default_config
+
+
+def set_default_config(config):
+    global _default_config
+    _default_config = config
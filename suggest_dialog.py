@@ -0,0 +1,116 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QPushButton, QDoubleSpinBox,
+                             QTabWidget, QTableWidget, QTableWidgetItem, QHeaderView, QMessageBox)
+
+from meal_suggester import DEFAULT_TARGETS
+
+TARGET_FIELDS = (
+    ("Ккал:", 10000),
+    ("Белки, г:", 1000),
+    ("Жиры, г:", 1000),
+    ("Углеводы, г:", 1000),
+)
+SUGGESTION_COLUMNS = ("Блюда", "Ккал", "Б, г", "Ж, г", "У, г", "Отклонение")
+
+
+class SuggestDialog(QDialog):
+    # Подбор блюд под остаток дневной нормы КБЖУ за выбранную дату
+    # (Database.suggest_dishes в фоновом потоке); выбранный вариант можно
+    # сразу записать как прием пищи
+    def __init__(self, date, targets=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Подбор блюд под дневную норму")
+        self.resize(750, 600)
+
+        self.db = self.parent().db
+        self.date = date
+        # Варианты, показанные в таблицах: [(состав, КБЖУ, ошибка), ...]
+        self.suggestions = {}
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel(f"Дневная норма (остаток считается по записям за {date}):"))
+        targets_layout = QFormLayout()
+        self.target_inputs = []
+        for (label, maximum), value in zip(TARGET_FIELDS, targets or DEFAULT_TARGETS):
+            spin_box = QDoubleSpinBox(self)
+            spin_box.setRange(0, maximum)
+            spin_box.setDecimals(0)
+            spin_box.setValue(value)
+            targets_layout.addRow(label, spin_box)
+            self.target_inputs.append(spin_box)
+        layout.addLayout(targets_layout)
+
+        suggest_button = QPushButton("Подобрать", self)
+        suggest_button.clicked.connect(self.suggest)
+        layout.addWidget(suggest_button)
+
+        self.remaining_label = QLabel(self)
+        layout.addWidget(self.remaining_label)
+
+        self.tabs = QTabWidget(self)
+        self.singles_table = self.create_table()
+        self.pairs_table = self.create_table()
+        self.tabs.addTab(self.singles_table, "Одно блюдо")
+        self.tabs.addTab(self.pairs_table, "Два блюда")
+        layout.addWidget(self.tabs)
+
+        buttons_layout = QHBoxLayout()
+        track_button = QPushButton("Записать выбранный вариант", self)
+        track_button.clicked.connect(self.track_selected)
+        buttons_layout.addWidget(track_button)
+        close_button = QPushButton("Закрыть", self)
+        close_button.clicked.connect(self.close)
+        buttons_layout.addWidget(close_button)
+        layout.addLayout(buttons_layout)
+
+        self.setLayout(layout)
+        self.suggest()
+
+    def targets(self):
+        return tuple(spin_box.value() for spin_box in self.target_inputs)
+
+    def create_table(self):
+        table = QTableWidget(0, len(SUGGESTION_COLUMNS), self)
+        table.setHorizontalHeaderLabels(SUGGESTION_COLUMNS)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        table.setSelectionBehavior(QTableWidget.SelectRows)
+        table.setSelectionMode(QTableWidget.SingleSelection)
+        table.verticalHeader().hide()
+        return table
+
+    def suggest(self):
+        self.parent().db_worker.submit('suggest_dishes', 'suggest_dishes', self.date, self.targets(),
+                                       callback=self.show_suggestions)
+
+    def show_suggestions(self, result):
+        remaining, singles, pairs = result
+        kcal, proteins, fats, carbs = (max(value, 0) for value in remaining)
+        self.remaining_label.setText(f"Осталось до нормы: {kcal:.0f} ккал, Б {proteins:.1f} г, "
+                                     f"Ж {fats:.1f} г, У {carbs:.1f} г")
+        self.fill_table(self.singles_table, singles)
+        self.fill_table(self.pairs_table, pairs)
+
+    def fill_table(self, table, suggestions):
+        self.suggestions[id(table)] = suggestions
+        table.setRowCount(len(suggestions))
+        for row, (items, macros, error) in enumerate(suggestions):
+            # Отклонение - среднеквадратичное по КБЖУ, в долях дневной нормы
+            values = (", ".join(f"{name} {grams:.0f} г" for name, grams in items),
+                      *(f"{value:.1f}" for value in macros), f"{(error / 4) ** 0.5:.1%}")
+            for column, value in enumerate(values):
+                table.setItem(row, column, QTableWidgetItem(value))
+
+    def track_selected(self):
+        table = self.tabs.currentWidget()
+        rows = table.selectionModel().selectedRows()
+        if not rows:
+            QMessageBox.warning(self, "Ошибка", "Выберите вариант в таблице")
+            return
+        items, _, _ = self.suggestions[id(table)][rows[0].row()]
+        try:
+            total_calories = self.db.track_meal(items, self.date)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
+        QMessageBox.information(self, "Результат", f"{total_calories:.2f} ккал добавлено за {self.date}.")
+        self.suggest()
@@ -0,0 +1,96 @@
+from datetime import date, datetime, time, timedelta
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+def _read_totals(db, day):
+    # Сверка читает daily_totals в обход кэша результатов: он не замечает
+    # записей из других процессов
+    return tuple(db._query_data_by_date(day))
+
+
+class TodayTotals(QObject):
+    # Суммы КБЖУ за сегодня в памяти для панели "Потреблено сегодня".
+    # Загружаются из базы один раз, затем к ним прибавляются новые записи
+    # журнала (Database.add_log_listener). В полночь суммы переходят на
+    # новый день, а раз в RECONCILE_MS сверяются с базой.
+
+    changed = pyqtSignal(object)
+
+    RECONCILE_MS = 5 * 60 * 1000
+    # Запас после полуночи, чтобы таймер точно сработал уже в новом дне
+    ROLLOVER_MARGIN_MS = 1000
+
+    def __init__(self, db, db_worker, parent=None):
+        super().__init__(parent)
+        self.db_worker = db_worker
+        self.date = date.today().isoformat()
+        self.totals = (0, 0, 0, 0)
+        self._loaded = False
+        # Растет при каждом изменении сумм в памяти: сверка, запрошенная
+        # раньше, могла не увидеть эту запись, и ее результат отбрасывается
+        self._version = 0
+        db.add_log_listener(self.log_changed)
+
+        self.rollover_timer = QTimer(self)
+        self.rollover_timer.setSingleShot(True)
+        self.rollover_timer.timeout.connect(self.check_date)
+        self.reconcile_timer = QTimer(self)
+        self.reconcile_timer.timeout.connect(self.reconcile)
+        self.reconcile_timer.start(self.RECONCILE_MS)
+        self._schedule_rollover()
+        self.reconcile()
+
+    def log_changed(self, dates, macros):
+        if dates is not None and self.date not in dates:
+            return
+        if macros is None or not self._loaded:
+            # Удаление или пересчет истории: суммы за день берутся из базы
+            self._version += 1
+            self.reconcile()
+            return
+        self.totals = tuple(total + value for total, value in zip(self.totals, macros))
+        self._version += 1
+        self.changed.emit(self.totals)
+
+    def reconcile(self):
+        if self._date_changed():
+            return
+        day, version = self.date, self._version
+        self.db_worker.submit('today_totals', _read_totals, day,
+                              callback=lambda totals: self._reconciled(day, version, totals))
+
+    def _reconciled(self, day, version, totals):
+        if day != self.date:
+            return
+        if version != self._version:
+            self.reconcile()
+            return
+        loaded, self._loaded = self._loaded, True
+        if not loaded or totals != self.totals:
+            self.totals = totals
+            self.changed.emit(self.totals)
+
+    def check_date(self):
+        if not self._date_changed():
+            self._schedule_rollover()
+
+    def _date_changed(self):
+        # Таймер мог сработать позже (например, после спящего режима),
+        # поэтому день проверяется и при каждой сверке
+        today = date.today().isoformat()
+        if today == self.date:
+            return False
+        self.date = today
+        self.totals = (0, 0, 0, 0)
+        self._loaded = False
+        self._version += 1
+        self.changed.emit(self.totals)
+        self._schedule_rollover()
+        self.reconcile()
+        return True
+
+    def _schedule_rollover(self):
+        midnight = datetime.combine(date.today() + timedelta(days=1), time.min)
+        remaining_ms = (midnight - datetime.now()).total_seconds() * 1000
+        self.rollover_timer.start(int(remaining_ms) + self.ROLLOVER_MARGIN_MS)